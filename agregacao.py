@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+
+
+def colunas_agregacao(params, dict_fcns):
+    '''
+    Para cada coluna de saída de dict_fcns: (índice da variável de origem em
+    "params", operação). Colunas "X_MINIMO"/"X_MAXIMO" vêm da variável X.
+    '''
+    ret = []
+    for col, fcn in dict_fcns.items():
+        origem = col
+        for sufixo in ['_MINIMO', '_MAXIMO']:
+            if col.endswith(sufixo):
+                origem = col[:-len(sufixo)]
+        op = {np.mean: 'mean', np.min: 'min', np.max: 'max'}[fcn]
+        ret.append((params.index(origem), op))
+    return ret
+
+
+def _reduz_segmentos(soma, contagem, minimo, maximo, inicio, n):
+    '''
+    Soma, contagem, mínimo e máximo de cada segmento do eixo 1, que começa em
+    "inicio" (crescente). Segmentos vazios ficam com contagem 0.
+    '''
+    vazio = np.diff(np.append(inicio, soma.shape[1])) == 0
+    idx = np.minimum(inicio, soma.shape[1] - 1)
+
+    ret = (
+        np.add.reduceat(soma, idx, axis=1),
+        np.add.reduceat(contagem, idx, axis=1),
+        np.minimum.reduceat(minimo, idx, axis=1),
+        np.maximum.reduceat(maximo, idx, axis=1),
+    )
+    ret[0][:, vazio, :] = 0
+    ret[1][:, vazio, :] = 0
+    ret[2][:, vazio, :] = np.inf
+    ret[3][:, vazio, :] = -np.inf
+    return ret
+
+
+def parciais_mensais(dates, cubo):
+    '''
+    Estado parcial de cada mês, calculado em uma única passada pelos dias.
+
+    "cubo": (pontos x dias x variáveis), com os dias de "dates" (crescentes).
+    Retorna {'meses': ano*12 + mês de cada mês (contínuos), 'soma',
+    'contagem', 'minimo', 'maximo': (pontos x meses x variáveis), 'ultimo_dia'}.
+    Dias NaN são ignorados; meses sem dado têm contagem 0 e mínimo/máximo
+    infinitos.
+    '''
+    mes = np.asarray(dates.year * 12 + dates.month)
+    meses = np.arange(mes[0], mes[-1] + 1)
+    inicio = np.searchsorted(mes, meses)
+
+    nan = np.isnan(cubo)
+    soma, contagem, minimo, maximo = _reduz_segmentos(
+        np.where(nan, 0.0, cubo),
+        (~nan).astype(np.float64),
+        np.where(nan, np.inf, cubo),
+        np.where(nan, -np.inf, cubo),
+        inicio,
+        len(meses),
+    )
+    return {
+        'meses': meses,
+        'soma': soma,
+        'contagem': contagem,
+        'minimo': minimo,
+        'maximo': maximo,
+        'ultimo_dia': pd.Timestamp(dates[-1]),
+    }
+
+
+def combina_parciais(antigas, novas):
+    '''
+    Substitui, nas parciais "antigas", os meses a partir do primeiro mês das
+    "novas".
+    '''
+    manter = antigas['meses'] < novas['meses'][0]
+    ret = {'meses': np.concatenate([antigas['meses'][manter], novas['meses']])}
+    for chave in ['soma', 'contagem', 'minimo', 'maximo']:
+        ret[chave] = np.concatenate([antigas[chave][:, manter], novas[chave]], axis=1)
+    ret['ultimo_dia'] = novas['ultimo_dia']
+    return ret
+
+
+def _fim_do_mes(mes):
+    return pd.Timestamp((mes - 1) // 12, (mes - 1) % 12 + 1, 1) + pd.offsets.MonthEnd(0)
+
+
+def rollup(parciais, meses, colunas):
+    '''
+    Agrega as parciais mensais em períodos de "meses" meses, com os mesmos
+    rótulos de resample(f'{meses}M'): o primeiro período termina no fim do
+    primeiro mês e cada período cobre (rótulo - meses, rótulo]. "meses" None:
+    um período só (histórico), rotulado com o último dia. Retorna (rótulos,
+    pontos x períodos x colunas).
+    '''
+    k = parciais['meses'] - parciais['meses'][0]
+    if meses is None:
+        indices = np.zeros(len(k), dtype=np.int64)
+        rotulos = pd.DatetimeIndex([parciais['ultimo_dia']])
+    else:
+        indices = -((-k) // meses)
+        rotulo_0 = _fim_do_mes(int(parciais['meses'][0]))
+        rotulos = pd.DatetimeIndex([rotulo_0 + pd.offsets.MonthEnd(int(i) * meses)
+                                    for i in range(indices[-1] + 1)])
+
+    inicio = np.searchsorted(indices, np.arange(len(rotulos)))
+    soma, contagem, minimo, maximo = _reduz_segmentos(
+        parciais['soma'], parciais['contagem'], parciais['minimo'], parciais['maximo'],
+        inicio, len(rotulos),
+    )
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        reducoes = {'mean': soma / contagem, 'min': minimo, 'max': maximo}
+
+    valores = np.empty((soma.shape[0], len(rotulos), len(colunas)))
+    for c, (v, op) in enumerate(colunas):
+        valores[:, :, c] = reducoes[op][:, :, v]
+    valores[contagem[:, :, [v for v, _ in colunas]] == 0] = np.nan
+
+    return rotulos, valores
+
+
+def resample_parciais(parciais, params, dict_fcns, periodos):
+    '''
+    Todos os períodos a partir das parciais mensais: {período: (rótulos,
+    pontos x períodos x colunas de dict_fcns)}.
+    '''
+    colunas = colunas_agregacao(params, dict_fcns)
+    return {periodo: rollup(parciais, meses, colunas) for periodo, meses in periodos.items()}
@@ -1,19 +1,161 @@
-from time import sleep
+import asyncio
+import weakref
+from datetime import date, datetime, timedelta
+from time import monotonic, sleep
 from typing import Dict, List, Text, Tuple, Union
 
+import aiohttp
 import pandas as pd
 from numpy.random import randn
 from requests import Response, get
 from requests.exceptions import Timeout
 
+from cache_nasa import CacheNasa
+
+
+# Endereço da API diária; pode apontar para um servidor local em testes.
+url_api = 'https://power.larc.nasa.gov/api/temporal/daily'
+
+# Códigos em que a NASA indica sobrecarga: a pausa vale para todas as requisições.
+codes_throttle = (429, 503)
+
+# Códigos que reduzem a concorrência no controle adaptativo (além de timeouts).
+codes_sobrecarga = (429, 503, 504)
+
+# Telemetria (telemetria.Telemetria) das requisições; None: não registra.
+telemetria = None
+
+# Tentativas de cada requisição assíncrona antes de desistir (ver _get_async).
+tentativas_requisicao = 5
+
+
+class ErroRequisicao(Exception):
+    '''
+    Requisição à NASA sem sucesso: erro do cliente (4xx, exceto 429) ou
+    tentativas esgotadas.
+    '''
+
+
+class LimitadorTaxa:
+    '''
+    Token bucket compartilhado por todas as requisições assíncronas: no máximo
+    "taxa" requisições por segundo, com rajadas de até "capacidade". Uma pausa
+    (pausar) bloqueia novas requisições de todos os workers até expirar.
+    '''
+
+    def __init__(self, taxa: float, capacidade: Union[float, None] = None):
+        self.taxa = taxa
+        self.capacidade = capacidade if capacidade is not None else max(1.0, taxa)
+        self._tokens = self.capacidade
+        self._ultimo = monotonic()
+        self._pausa_ate = 0.0
+        self._lock = asyncio.Lock()
+
+    def pausar(self, segundos: float):
+        self._pausa_ate = max(self._pausa_ate, monotonic() + segundos)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                agora = monotonic()
+                if agora < self._pausa_ate:
+                    await asyncio.sleep(self._pausa_ate - agora)
+                    continue
+
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.taxa)
+
+
+class ControleConcorrencia:
+    '''
+    Controle AIMD do número de requisições simultâneas: cada sucesso soma
+    1/limite ao limite (cerca de +1 por rodada de requisições) e cada
+    429/503/504 ou timeout multiplica o limite por "fator_corte". Cortes
+    seguidos, dentro de uma latência média, contam como um só, pois vêm da
+    mesma rajada. A latência das respostas 200 é acompanhada por média móvel.
+    '''
+
+    def __init__(self,
+                 inicial: int = 5,
+                 minimo: int = 1,
+                 maximo: int = 20,
+                 fator_corte: float = 0.5,
+                 alpha: float = 0.2):
+        self.limite = float(max(minimo, min(inicial, maximo)))
+        self.minimo = minimo
+        self.maximo = maximo
+        self.fator_corte = fator_corte
+        self.alpha = alpha
+
+        self.latencia = None
+        self.em_andamento = 0
+        self.sucessos = 0
+        self.sobrecargas = 0
+        self.cortes = 0
+        self.limite_max_atingido = self.limite
+
+        self._ultimo_corte = 0.0
+        self._condicao = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condicao:
+            await self._condicao.wait_for(lambda: self.em_andamento < int(self.limite))
+            self.em_andamento += 1
+
+    async def release(self, resultado: Text, latencia: Union[float, None] = None):
+        '''
+        "resultado": 'sucesso', 'sobrecarga' ou 'erro' (não altera o limite).
+        '''
+        async with self._condicao:
+            self.em_andamento -= 1
+
+            if resultado == 'sucesso':
+                self.sucessos += 1
+                if latencia is not None:
+                    if self.latencia is None:
+                        self.latencia = latencia
+                    else:
+                        self.latencia = (1 - self.alpha) * self.latencia + self.alpha * latencia
+                self.limite = min(self.maximo, self.limite + 1 / self.limite)
+                self.limite_max_atingido = max(self.limite_max_atingido, self.limite)
+            elif resultado == 'sobrecarga':
+                self.sobrecargas += 1
+                agora = monotonic()
+                if agora - self._ultimo_corte > (self.latencia or 1.0):
+                    self.limite = max(self.minimo, self.limite * self.fator_corte)
+                    self.cortes += 1
+                    self._ultimo_corte = agora
+
+            self._condicao.notify_all()
+
+    def resumo(self) -> Dict:
+        return {
+            'limite': round(self.limite, 2),
+            'limite_max_atingido': round(self.limite_max_atingido, 2),
+            'latencia_media': None if self.latencia is None else round(self.latencia, 3),
+            'sucessos': self.sucessos,
+            'sobrecargas': self.sobrecargas,
+            'cortes': self.cortes,
+        }
+
 
 def _get(link: str, params: Union[Dict, None] = None) -> Response:
     while True:
+        inicio = monotonic()
         try:
             response = get(link, params, timeout=30)
         except Timeout:
+            if telemetria is not None:
+                telemetria.registra_requisicao(monotonic() - inicio, 'timeout')
+                telemetria.registra_retentativa('timeout')
             continue
         code = response.status_code
+        if telemetria is not None:
+            telemetria.registra_requisicao(monotonic() - inicio, code, len(response.content))
 
         if code == 200:
             return response
@@ -23,15 +165,151 @@ def _get(link: str, params: Union[Dict, None] = None) -> Response:
             t = abs(60*(5 + randn()))
         print(f'Status code: {code}')
         print(f'Tentando novamente em {t:.0f} segundos')
+        if telemetria is not None:
+            telemetria.registra_retentativa(code, t)
         sleep(t)
 
 
-def get_nasa_point(lat_lon: Tuple,
-                   params: Union[List, Text],
-                   start_date: int,
-                   end_date: int,
-                   temp_average: Text,
-                   outputList: Union[List, Text] = 'CSV') -> Dict:
+async def _get_async(session: aiohttp.ClientSession,
+                     link: str,
+                     params: Dict,
+                     limitador: Union[LimitadorTaxa, None] = None,
+                     controle: Union[ControleConcorrencia, None] = None,
+                     tentativas: Union[int, None] = None) -> bytes:
+    '''
+    Versão assíncrona de _get. No máximo uma requisição por conexão da
+    sessão fica em andamento (semaforo_sessao): as demais esperam fora do
+    pool, sem contar para o timeout. A espera entre tentativas não bloqueia as
+    demais requisições; em 429/503 a pausa é aplicada no limitador, para
+    todos os workers ao mesmo tempo. Com "controle", o número de requisições
+    simultâneas se adapta às respostas da NASA.
+
+    Faz até "tentativas" (padrão: tentativas_requisicao) tentativas e levanta
+    ErroRequisicao quando elas se esgotam ou, sem repetir, em um 4xx que não
+    seja 429, para que o chamador (baixa_trechos_async, download_pontos)
+    decida o que repetir.
+    '''
+    if tentativas is None:
+        tentativas = tentativas_requisicao
+    params = {k: str(v) for k, v in params.items()}
+    for tentativa in range(1, tentativas + 1):
+        if controle is not None:
+            await controle.acquire()
+
+        code = None
+        timeout = False
+        tamanho = 0
+        async with semaforo_sessao(session):
+            if limitador is not None:
+                await limitador.acquire()
+
+            inicio = monotonic()
+            try:
+                async with session.get(link, params=params) as response:
+                    code = response.status
+                    if code == 200:
+                        conteudo = await response.read()
+                        tamanho = len(conteudo)
+            except asyncio.TimeoutError:
+                timeout = True
+            except aiohttp.ClientError:
+                pass
+
+        status = code if code is not None else ('timeout' if timeout else 'erro')
+        if telemetria is not None:
+            telemetria.registra_requisicao(monotonic() - inicio, status, tamanho)
+
+        if controle is not None:
+            if code == 200:
+                await controle.release('sucesso', monotonic() - inicio)
+            elif timeout or code in codes_sobrecarga:
+                await controle.release('sobrecarga')
+            else:
+                await controle.release('erro')
+
+        if code == 200:
+            return conteudo
+        if code is not None and 400 <= code < 500 and code not in codes_throttle:
+            raise ErroRequisicao(f'Status code: {code} ({link})')
+        if tentativa == tentativas:
+            break
+        if code is None:
+            if telemetria is not None:
+                telemetria.registra_retentativa(status)
+            continue
+
+        if code == 504:
+            t = abs(10+randn())
+        else:
+            t = abs(60*(5 + randn()))
+        print(f'Status code: {code}')
+        print(f'Tentando novamente em {t:.0f} segundos')
+        if telemetria is not None:
+            telemetria.registra_retentativa(code, t)
+
+        if limitador is not None and code in codes_throttle:
+            limitador.pausar(t)
+        else:
+            await asyncio.sleep(t)
+
+    raise ErroRequisicao(f'Status: {status} após {tentativas} tentativas ({link})')
+
+
+async def _get_cached_async(session: aiohttp.ClientSession,
+                            link: str,
+                            payload: Dict,
+                            cache: Union[CacheNasa, None] = None,
+                            limitador: Union[LimitadorTaxa, None] = None,
+                            controle: Union[ControleConcorrencia, None] = None) -> bytes:
+
+    if cache is not None:
+        conteudo = cache.get_raw(link, payload)
+        if conteudo is not None:
+            return conteudo
+
+    conteudo = await _get_async(session, link, payload, limitador, controle)
+
+    if cache is not None:
+        cache.put(link, payload, conteudo)
+
+    return conteudo
+
+
+def nova_sessao(conexoes: int, timeout: float = 30) -> aiohttp.ClientSession:
+    '''
+    Sessão com conexões keep-alive reaproveitadas entre requisições. O
+    "timeout" vale para conectar e para cada leitura, não para o tempo total:
+    a espera por uma conexão livre do pool não conta como falha.
+    '''
+    connector = aiohttp.TCPConnector(limit=conexoes, limit_per_host=conexoes, keepalive_timeout=60)
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout),
+    )
+
+
+# Semáforo de cada sessão (ver semaforo_sessao).
+_semaforos = weakref.WeakKeyDictionary()
+
+
+def semaforo_sessao(session: aiohttp.ClientSession) -> asyncio.Semaphore:
+    '''
+    Semáforo com o número de conexões da sessão, que limita as requisições
+    em andamento: os trechos de baixa_trechos_async, disparados juntos,
+    esperam por ele em vez de ocupar o pool.
+    '''
+    if session not in _semaforos:
+        limite = session.connector.limit if session.connector is not None else 0
+        _semaforos[session] = asyncio.Semaphore(limite if limite > 0 else 100)
+    return _semaforos[session]
+
+
+def _payload(lat_lon: Tuple,
+             params: Union[List, Text],
+             start_date: int,
+             end_date: int,
+             temp_average: Text,
+             outputList: Union[List, Text] = 'CSV') -> Dict:
 
     lat, lon = lat_lon
     if isinstance(params, List):
@@ -40,7 +318,7 @@ def get_nasa_point(lat_lon: Tuple,
     if isinstance(outputList, List):
         outputList = ','.join(outputList)
 
-    payload = {
+    return {
         'start': start_date,
         'end': end_date,
         'request': 'execute',
@@ -53,8 +331,185 @@ def get_nasa_point(lat_lon: Tuple,
         'outputList': outputList,
         'user': 'UFPB'
     }
-    base = 'https://power.larc.nasa.gov/api/temporal/daily/point'
+
+
+def get_nasa_point(lat_lon: Tuple,
+                   params: Union[List, Text],
+                   start_date: int,
+                   end_date: int,
+                   temp_average: Text,
+                   outputList: Union[List, Text] = 'CSV',
+                   cache: Union[CacheNasa, None] = None) -> Dict:
+
+    payload = _payload(lat_lon, params, start_date, end_date, temp_average, outputList)
+    base = f'{url_api}/point'
+
+    if cache is not None:
+        data = cache.get(base, payload)
+        if data is not None:
+            return data
 
     response = _get(base, payload)
 
+    if cache is not None:
+        cache.put(base, payload, response.content)
+
     return response.json()
+
+
+async def get_nasa_point_async(session: aiohttp.ClientSession,
+                               lat_lon: Tuple,
+                               params: Union[List, Text],
+                               start_date: int,
+                               end_date: int,
+                               temp_average: Text,
+                               outputList: Union[List, Text] = 'CSV',
+                               cache: Union[CacheNasa, None] = None,
+                               limitador: Union[LimitadorTaxa, None] = None,
+                               controle: Union[ControleConcorrencia, None] = None) -> bytes:
+    '''
+    Retorna o conteúdo bruto (JSON) da resposta, para ser interpretado fora
+    do event loop.
+    '''
+    payload = _payload(lat_lon, params, start_date, end_date, temp_average, outputList)
+    return await _get_cached_async(session, f'{url_api}/point', payload, cache, limitador, controle)
+
+
+def divide_intervalo(start_date: int, end_date: int, anos: Union[int, None] = 1) -> List[Tuple[int, int]]:
+    '''
+    Divide [start_date, end_date] (aaaammdd) em trechos de "anos" anos do
+    calendário (o primeiro e o último podem ser parciais), para que os
+    trechos completos tenham sempre o mesmo payload (e a mesma entrada no
+    cache). "anos" None ou 0: um trecho só.
+    '''
+    if not anos:
+        return [(start_date, end_date)]
+
+    inicio = datetime.strptime(str(start_date), '%Y%m%d').date()
+    fim = datetime.strptime(str(end_date), '%Y%m%d').date()
+    ret = []
+    while inicio <= fim:
+        fim_trecho = min(date(inicio.year + anos, 1, 1) - timedelta(days=1), fim)
+        ret.append((int(inicio.strftime('%Y%m%d')), int(fim_trecho.strftime('%Y%m%d'))))
+        inicio = fim_trecho + timedelta(days=1)
+    return ret
+
+
+async def baixa_trechos_async(baixa, start_date: int, end_date: int,
+                              anos: Union[int, None] = 1, tentativas: int = 3) -> List:
+    '''
+    Chama "baixa(start, end)" (corrotina) para cada trecho de
+    divide_intervalo, em paralelo (as requisições em andamento são limitadas
+    pelas conexões da sessão, ver semaforo_sessao), e retorna os resultados
+    na ordem das datas. Só os trechos que falharam são repetidos, até
+    "tentativas" vezes.
+    '''
+    intervalos = divide_intervalo(start_date, end_date, anos)
+    resultados = [None] * len(intervalos)
+    pendentes = list(range(len(intervalos)))
+
+    for _ in range(tentativas):
+        respostas = await asyncio.gather(
+            *(baixa(*intervalos[i]) for i in pendentes), return_exceptions=True
+        )
+        erros = []
+        for i, resposta in zip(pendentes, respostas):
+            if isinstance(resposta, asyncio.CancelledError):
+                raise resposta
+            if isinstance(resposta, Exception):
+                erros.append(resposta)
+            else:
+                resultados[i] = resposta
+        pendentes = [i for i, resposta in zip(pendentes, respostas) if isinstance(resposta, Exception)]
+        if len(pendentes) == 0:
+            return resultados
+
+    raise erros[-1]
+
+
+async def get_nasa_point_trechos_async(session: aiohttp.ClientSession,
+                                       lat_lon: Tuple,
+                                       params: Union[List, Text],
+                                       start_date: int,
+                                       end_date: int,
+                                       temp_average: Text,
+                                       outputList: Union[List, Text] = 'CSV',
+                                       cache: Union[CacheNasa, None] = None,
+                                       limitador: Union[LimitadorTaxa, None] = None,
+                                       controle: Union[ControleConcorrencia, None] = None,
+                                       anos_trecho: Union[int, None] = 1) -> List[bytes]:
+    '''
+    get_nasa_point_async com o intervalo dividido em trechos de
+    "anos_trecho" anos, baixados em paralelo. Retorna o conteúdo bruto de
+    cada trecho, na ordem das datas.
+    '''
+    async def baixa(start, end):
+        return await get_nasa_point_async(
+            session, lat_lon, params, start, end, temp_average, outputList,
+            cache=cache, limitador=limitador, controle=controle,
+        )
+
+    return await baixa_trechos_async(baixa, start_date, end_date, anos_trecho)
+
+
+async def get_nasa_regional_async(session: aiohttp.ClientSession,
+                                  bbox: Tuple,
+                                  params: List,
+                                  start_date: int,
+                                  end_date: int,
+                                  temp_average: Text,
+                                  cache: Union[CacheNasa, None] = None,
+                                  limitador: Union[LimitadorTaxa, None] = None,
+                                  controle: Union[ControleConcorrencia, None] = None) -> List[bytes]:
+    '''
+    Baixa a região "bbox" = (lat_min, lat_max, lon_min, lon_max) pelo endpoint
+    regional. A NASA aceita um parâmetro por requisição regional, então é feita
+    uma requisição por parâmetro, em paralelo. Retorna o conteúdo bruto de cada
+    uma (FeatureCollection com uma feature por célula da grade nativa).
+    '''
+    lat_min, lat_max, lon_min, lon_max = bbox
+
+    def payload(param):
+        return {
+            'start': start_date,
+            'end': end_date,
+            'latitude-min': lat_min,
+            'latitude-max': lat_max,
+            'longitude-min': lon_min,
+            'longitude-max': lon_max,
+            'community': 'SB',
+            'parameters': param,
+            'format': 'JSON',
+            'tempAverage': temp_average,
+            'user': 'UFPB'
+        }
+
+    return await asyncio.gather(*(
+        _get_cached_async(session, f'{url_api}/regional', payload(param), cache, limitador, controle)
+        for param in params
+    ))
+
+
+async def get_nasa_regional_trechos_async(session: aiohttp.ClientSession,
+                                          bbox: Tuple,
+                                          params: List,
+                                          start_date: int,
+                                          end_date: int,
+                                          temp_average: Text,
+                                          cache: Union[CacheNasa, None] = None,
+                                          limitador: Union[LimitadorTaxa, None] = None,
+                                          controle: Union[ControleConcorrencia, None] = None,
+                                          anos_trecho: Union[int, None] = 1) -> List[bytes]:
+    '''
+    get_nasa_regional_async com o intervalo dividido em trechos de
+    "anos_trecho" anos. Retorna o conteúdo bruto de todas as requisições
+    (trechos na ordem das datas, um conteúdo por parâmetro em cada trecho).
+    '''
+    async def baixa(start, end):
+        return await get_nasa_regional_async(
+            session, bbox, params, start, end, temp_average,
+            cache=cache, limitador=limitador, controle=controle,
+        )
+
+    trechos = await baixa_trechos_async(baixa, start_date, end_date, anos_trecho)
+    return [conteudo for conteudos in trechos for conteudo in conteudos]
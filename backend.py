@@ -1,10 +1,21 @@
+import os
 import json
+import math
+import time
+import asyncio
 import numpy as np
 import pandas as pd
 from distutils.dir_util import mkpath
+from concurrent.futures import ProcessPoolExecutor
 
 
-from api_nasa import get_nasa_point
+import api_nasa
+import bd_parquet
+from agregacao import combina_parciais, parciais_mensais, resample_parciais
+from manifesto import ManifestoDownload, checksums_arquivos
+from telemetria import Cronometro
+from api_nasa import (LimitadorTaxa, get_nasa_point, get_nasa_point_trechos_async,
+                      get_nasa_regional_trechos_async, nova_sessao)
 
 
 params = ['QV2M',
@@ -54,28 +65,225 @@ def remove_outliers(df):
     return df.interpolate()
 
 
-def resample_MBTSAH(df):
-    df.index = pd.to_datetime(df.index)
+def le_parametros(data):
+    '''
+    Lê o bloco "parameter" de uma resposta da NASA direto para arrays, em
+    uma passada por parâmetro: (point, inicio, dias, valores), com "dias"
+    em int32 (deslocamento de cada data, em dias, a partir de "inicio") e
+    "valores" contíguo (dias x params), com -999 trocado por NaN.
+    '''
+    point = data['geometry']['coordinates']
+    parametros = data['properties']['parameter']
+    chaves = list(parametros[params[0]])
+    n = len(chaves)
+
+    aaaammdd = np.array(chaves).astype(np.int64)
+    datas = ((aaaammdd // 10000 - 1970).astype('datetime64[Y]')
+             + (aaaammdd // 100 % 100 - 1).astype('timedelta64[M]')).astype('datetime64[D]') \
+        + (aaaammdd % 100 - 1).astype('timedelta64[D]')
+
+    valores = np.empty((n, len(params)))
+    for j, param in enumerate(params):
+        serie = parametros[param]
+        if len(serie) == n:
+            valores[:, j] = np.fromiter(serie.values(), dtype=np.float64, count=n)
+        else:
+            valores[:, j] = [serie.get(chave, np.nan) for chave in chaves]
+    valores[valores == -999] = np.nan
+
+    if n > 1 and np.any(np.diff(datas) <= np.timedelta64(0, 'D')):
+        ordem = np.argsort(datas, kind='stable')
+        datas, valores = datas[ordem], valores[ordem]
+
+    inicio = pd.Timestamp(datas[0]) if n > 0 else None
+    dias = (datas - datas[0]).astype(np.int32) if n > 0 else np.zeros(0, dtype=np.int32)
+    return point, inicio, dias, valores
+
+
+def interpola_falhas(valores):
+    '''
+    Mesmo resultado de remove_outliers (interpolação linear dos NaN pela
+    posição; NaN iniciais mantidos, finais com o último valor), direto no
+    array (dias x variáveis).
+    '''
+    x = np.arange(valores.shape[0])
+    for j in range(valores.shape[1]):
+        coluna = valores[:, j]
+        nan = np.isnan(coluna)
+        if not nan.any() or nan.all():
+            continue
+        validos = np.flatnonzero(~nan)
+        coluna[nan] = np.interp(x[nan], validos, coluna[validos])
+        coluna[:validos[0]] = np.nan
+    return valores
+
 
+def ultimo_dia_completo(inicio, dias, valores):
+    '''
+    Última data com todos os parâmetros presentes nos valores brutos (antes
+    de interpola_falhas, que preenche os -999 do fim da série); None se
+    nenhum dia está completo.
+    '''
+    completos = np.flatnonzero(~np.isnan(valores).any(axis=1))
+    if len(completos) == 0:
+        return None
+    return inicio + pd.Timedelta(days=int(dias[completos[-1]]))
+
+
+def df_diario_arrays(inicio, dias, valores):
+    index = pd.DatetimeIndex(inicio + pd.to_timedelta(dias, unit='D'))
+    return pd.DataFrame(valores, index=index, columns=params)
+
+
+def add_extremos(df):
     df['T2M_MIN_MINIMO'] = df['T2M_MIN']
     df['T2M_MAX_MAXIMO'] = df['T2M_MAX']
     df['WS10M_MAX_MAXIMO'] = df['WS10M_MAX']
     df['WS50M_MAX_MAXIMO'] = df['WS50M_MAX']
     df['WS10M_MIN_MINIMO'] = df['WS10M_MIN']
     df['WS50M_MIN_MINIMO'] = df['WS50M_MIN']
+    return df
 
-    df_mes = df.resample('M').agg(dict_fcns)
-    df_bim = df.resample('2M').agg(dict_fcns)
-    df_tri = df.resample('3M').agg(dict_fcns)
-    df_sem = df.resample('6M').agg(dict_fcns)
-    df_ano = df.resample('12M').agg(dict_fcns)
 
-    aux = pd.DataFrame(df.agg(dict_fcns), columns=[df.index[-1]])
-    df_his = aux.transpose()
+def resample_MBTSAH(df):
+    df.index = pd.to_datetime(df.index)
+    df = add_extremos(df)
+
+    parciais = parciais_mensais(df.index, df[params].to_numpy(dtype=np.float64)[None])
+    df_mes, df_bim, df_tri, df_sem, df_ano, df_his = dataFrames_parciais(parciais)
 
     return df_mes, df_bim, df_tri, df_sem, df_ano, df_his
 
 
+def dataFrames_parciais(parciais, resultado=None, k=0):
+    '''
+    DataFrames dos seis períodos do k-ésimo ponto das parciais mensais (ou
+    de "resultado", já calculado por resample_parciais).
+    '''
+    if resultado is None:
+        resultado = resample_parciais(parciais, params, dict_fcns, periodos)
+    return [pd.DataFrame(valores[k], index=rotulos, columns=list(dict_fcns))
+            for rotulos, valores in resultado.values()]
+
+
+# Resolução (lat, lon) da grade nativa da NASA POWER para meteorologia (MERRA-2).
+resolucao_nativa = (0.5, 0.625)
+
+
+# Número de meses de cada período de agregação (None: todo o histórico).
+periodos = {
+    'mensal': 1,
+    'bimestral': 2,
+    'trimestral': 3,
+    'semestral': 6,
+    'anual': 12,
+    'histórico': None,
+}
+
+
+def load_periodo(point, periodo, foldername):
+    name_file = f"{point[0]}_{point[1]}"
+    df = pd.read_csv(f'{foldername}/{periodo}/{name_file}.csv', index_col=0)
+    df.index = pd.to_datetime(df.index.astype(str), format='%Y%m%d')
+    return df
+
+
+def load_diario(point, foldername):
+    '''
+    Série diária limpa do ponto, do arquivo binário salvo por save_diario
+    (ou do csv de versões anteriores). None se o ponto não tem diário.
+    '''
+    name_file = f"{point[0]}_{point[1]}"
+    filename = f'{foldername}/diário/{name_file}.npz'
+    if not os.path.isfile(filename):
+        if os.path.isfile(f'{foldername}/diário/{name_file}.csv'):
+            return load_periodo(point, 'diário', foldername)
+        return None
+
+    with np.load(filename) as f:
+        inicio = pd.Timestamp(str(f['inicio']))
+        index = inicio + pd.to_timedelta(f['dias'], unit='D')
+        return pd.DataFrame(f['valores'].astype(np.float64), index=index, columns=list(f['params']))
+
+
+def load_ultimo_completo(point, foldername):
+    '''
+    Último dia completo registrado por save_diario. None se não há registro
+    (diário de versões anteriores) e NaT se nenhum dia estava completo.
+    '''
+    name_file = f"{point[0]}_{point[1]}"
+    filename = f'{foldername}/diário/{name_file}.npz'
+    if not os.path.isfile(filename):
+        return None
+    with np.load(filename) as f:
+        if 'ultimo_completo' not in f.files:
+            return None
+        ultimo = str(f['ultimo_completo'])
+    return pd.Timestamp(ultimo) if len(ultimo) > 0 else pd.NaT
+
+
+def load_parciais(point, foldername):
+    name_file = f"{point[0]}_{point[1]}"
+    filename = f'{foldername}/parciais/{name_file}.npz'
+    if not os.path.isfile(filename):
+        return None
+    with np.load(filename) as f:
+        ret = {chave: f[chave][None] for chave in ['soma', 'contagem', 'minimo', 'maximo']}
+        ret['meses'] = f['meses']
+        ret['ultimo_dia'] = pd.Timestamp(str(f['ultimo_dia']))
+    return ret
+
+
+def save_parciais(point, parciais, foldername, k=0):
+    name_file = f"{point[0]}_{point[1]}"
+    np.savez(
+        f'{foldername}/parciais/{name_file}.npz',
+        meses=parciais['meses'],
+        soma=parciais['soma'][k],
+        contagem=parciais['contagem'][k],
+        minimo=parciais['minimo'][k],
+        maximo=parciais['maximo'][k],
+        ultimo_dia=parciais['ultimo_dia'].strftime('%Y%m%d'),
+    )
+
+
+def save_diario(point, df, foldername, ultimo_completo=None):
+    '''
+    Salva a série diária limpa do ponto em formato binário compacto
+    (".npz" comprimido): valores em float32 (dias x params) e as datas como
+    deslocamentos, em dias, a partir da primeira.
+
+    "ultimo_completo": último dia com todos os dados publicados pela NASA
+    (ver ultimo_dia_completo). Os dias seguintes foram preenchidos pela
+    limpeza e são baixados de novo no modo incremental.
+    '''
+    name_file = f"{point[0]}_{point[1]}"
+    inicio = df.index[0]
+    np.savez_compressed(
+        f'{foldername}/diário/{name_file}.npz',
+        inicio=inicio.strftime('%Y%m%d'),
+        dias=((df.index - inicio) // pd.Timedelta(days=1)).to_numpy(dtype=np.int32),
+        valores=df[params].to_numpy(dtype=np.float32),
+        params=np.array(params),
+        ultimo_completo=ultimo_completo.strftime('%Y%m%d') if ultimo_completo is not None else '',
+    )
+    legado = f'{foldername}/diário/{name_file}.csv'
+    if os.path.isfile(legado):
+        os.remove(legado)
+
+
+def arquivos_ponto(lat_lon, agrega=True):
+    '''
+    Arquivos gerados para o ponto, relativos à pasta de saída. Sem "agrega",
+    apenas o diário (os períodos são gerados depois, por processa_lote).
+    '''
+    name_file = f"{lat_lon[1]}_{lat_lon[0]}"
+    if not agrega:
+        return [f'diário/{name_file}.npz']
+    return [f'{periodo}/{name_file}.csv' for periodo in periodos] + \
+        [f'diário/{name_file}.npz', f'parciais/{name_file}.npz']
+
+
 def save(point, df_mes, df_bim, df_tri, df_sem, df_ano, df_his, foldername):
     name_file = f"{point[0]}_{point[1]}"
     df_mes.to_csv(f'{foldername}/mensal/{name_file}.csv', date_format='%Y%m%d')
@@ -88,15 +296,660 @@ def save(point, df_mes, df_bim, df_tri, df_sem, df_ano, df_his, foldername):
     #     json.dump(df_his.to_dict(), f)
 
 
-def pipeline(lat_lon, start_date, end_date, foldername):
+def prepara_pastas(foldername):
     mkpath(foldername + '/mensal')
     mkpath(foldername + '/bimestral')
     mkpath(foldername + '/trimestral')
     mkpath(foldername + '/semestral')
     mkpath(foldername + '/anual')
     mkpath(foldername + '/histórico')
-    data = get_nasa_point(lat_lon, params, start_date, end_date, 'DAILY')
-    point, df = to_dataFrame(data)
-    df = remove_outliers(df)
-    df_mes, df_bim, df_tri, df_sem, df_ano, df_his = resample_MBTSAH(df)
-    save(point, df_mes, df_bim, df_tri, df_sem, df_ano, df_his, foldername)
+    mkpath(foldername + '/diário')
+    mkpath(foldername + '/parciais')
+
+
+def planeja_download(lat_lon, start_date, end_date, foldername, incremental=False):
+    '''
+    Define o intervalo a baixar para o ponto: (start_date, end_date, df_diario).
+    Retorna None quando não falta nada.
+
+    No modo incremental, baixa apenas as datas após o último dia completo do
+    diário salvo ("df_diario", já cortado nesse dia). Esse dia é o
+    registrado por save_diario, antes do preenchimento dos -999: dias ainda
+    sem dado na NASA no fim da série são baixados de novo na próxima
+    execução. Sem diário salvo, ou com "start_date" anterior a ele, baixa
+    tudo.
+    '''
+    if not incremental:
+        return start_date, end_date, None
+
+    point = (lat_lon[1], lat_lon[0])
+    df_diario = load_diario(point, foldername)
+    inicio = pd.to_datetime(str(start_date), format='%Y%m%d')
+    fim = pd.to_datetime(str(end_date), format='%Y%m%d')
+
+    if df_diario is None or len(df_diario) == 0 or inicio < df_diario.index[0]:
+        return start_date, end_date, None
+
+    # Primeiro dia a baixar: após o último dia completo salvo.
+    ultimo = load_ultimo_completo(point, foldername)
+    if ultimo is None:
+        # Diário sem registro: usa os dias sem NaN.
+        completos = np.flatnonzero(df_diario.notna().all(axis=1).to_numpy())
+        ultimo = df_diario.index[completos[-1]] if len(completos) > 0 else pd.NaT
+    if pd.isna(ultimo):
+        return start_date, end_date, None
+    df_diario = df_diario.loc[df_diario.index <= ultimo]
+
+    date_afetada = df_diario.index[-1] + pd.DateOffset(1)
+    if date_afetada > fim:
+        return None
+
+    return int(date_afetada.strftime('%Y%m%d')), end_date, df_diario
+
+
+def processa_incremental(lat_lon, data, foldername, df_diario, agrega=True):
+    '''
+    Junta os dias baixados ao diário salvo e recalcula só as parciais dos
+    meses atingidos; os seis períodos saem das parciais.
+    '''
+    cronometro = Cronometro()
+    point = (lat_lon[1], lat_lon[0])
+    _, inicio, dias, valores = le_parametros(data)
+    date_afetada = df_diario.index[-1] + pd.DateOffset(1)
+    cronometro.marca('leitura')
+
+    ultimo = ultimo_dia_completo(inicio, dias, valores) or df_diario.index[-1]
+    valores = np.concatenate([df_diario[params].to_numpy(dtype=np.float64), valores])
+    index = df_diario.index.append(pd.DatetimeIndex(inicio + pd.to_timedelta(dias, unit='D')))
+    df = pd.DataFrame(interpola_falhas(valores), index=index, columns=params)
+    cronometro.marca('limpeza')
+    save_diario(point, df, foldername, ultimo)
+    cronometro.marca('gravacao')
+    if not agrega:
+        return cronometro.tempos
+
+    antigas = load_parciais(point, foldername)
+    cronometro.marca('leitura')
+    if antigas is None:
+        parciais = parciais_mensais(df.index, df[params].to_numpy(dtype=np.float64)[None])
+    else:
+        dff = df.loc[df.index >= date_afetada.replace(day=1)]
+        novas = parciais_mensais(dff.index, dff[params].to_numpy(dtype=np.float64)[None])
+        parciais = combina_parciais(antigas, novas)
+    dfs = dataFrames_parciais(parciais)
+    cronometro.marca('agregacao')
+
+    save_parciais(point, parciais, foldername)
+    save(point, *dfs, foldername)
+    cronometro.marca('gravacao')
+    return cronometro.tempos
+
+
+def processa(lat_lon, data, foldername, df_diario=None, agrega=True):
+    '''
+    Limpa e salva o diário do ponto e, se "agrega", as parciais mensais e os
+    seis períodos. Sem "agrega", os períodos são calculados depois, por
+    processa_lote. Retorna o tempo gasto em cada etapa ({etapa: segundos}).
+    '''
+    if df_diario is not None:
+        return processa_incremental(lat_lon, data, foldername, df_diario, agrega)
+
+    cronometro = Cronometro()
+    point, inicio, dias, valores = le_parametros(data)
+    cronometro.marca('leitura')
+    ultimo = ultimo_dia_completo(inicio, dias, valores)
+    df = df_diario_arrays(inicio, dias, interpola_falhas(valores))
+    cronometro.marca('limpeza')
+    save_diario(point, df, foldername, ultimo)
+    cronometro.marca('gravacao')
+    if not agrega:
+        return cronometro.tempos
+
+    parciais = parciais_mensais(df.index, df[params].to_numpy(dtype=np.float64)[None])
+    dfs = dataFrames_parciais(parciais)
+    cronometro.marca('agregacao')
+    save_parciais(point, parciais, foldername)
+    save(point, *dfs, foldername)
+    cronometro.marca('gravacao')
+    return cronometro.tempos
+
+
+def pipeline(lat_lon, start_date, end_date, foldername, cache=None, incremental=False):
+    prepara_pastas(foldername)
+    plano = planeja_download(lat_lon, start_date, end_date, foldername, incremental)
+    if plano is None:
+        return
+
+    start_date, end_date, df_diario = plano
+    data = get_nasa_point(lat_lon, params, start_date, end_date, 'DAILY', cache=cache)
+    tempos = processa(lat_lon, data, foldername, df_diario)
+    if api_nasa.telemetria is not None:
+        api_nasa.telemetria.registra_etapas(tempos)
+
+
+def processa_lote(points_lat_lon, foldername, tamanho_lote=128, armazenamento='csv', tamanho_tile=9.0):
+    '''
+    Calcula os seis períodos de todos os pontos a partir dos diários salvos,
+    de forma vetorizada: os pontos com o mesmo intervalo de datas são
+    empilhados em cubos (pontos x dias x variáveis) de até "tamanho_lote"
+    pontos e agregados de uma vez.
+
+    "armazenamento": 'csv' (um csv por ponto e período) ou 'parquet' (um
+    dataset colunar por período, "<período>/bd.parquet", particionado em
+    tiles de "tamanho_tile" graus, com um fragmento por lote). Retorna o
+    tempo gasto em cada etapa ({etapa: segundos}).
+    '''
+    cronometro = Cronometro()
+    parquet = armazenamento.upper() == 'PARQUET'
+    if parquet:
+        bd_parquet.limpa_datasets(foldername, periodos)
+
+    diarios = {}
+    for lat_lon in points_lat_lon:
+        df = load_diario((lat_lon[1], lat_lon[0]), foldername)
+        if df is not None and len(df) > 0:
+            diarios.setdefault((df.index[0], df.index[-1]), []).append((lat_lon, df))
+    cronometro.marca('leitura')
+
+    for (inicio, fim), lista in diarios.items():
+        dates = pd.date_range(inicio, fim)
+        if parquet:
+            dfs = dict(lista)
+            tiles = agrupa_tiles([lat_lon for lat_lon, _ in lista], tamanho_tile)
+            lotes = [[(lat_lon, dfs[lat_lon]) for lat_lon in tile[i:i + tamanho_lote]]
+                     for tile in tiles for i in range(0, len(tile), tamanho_lote)]
+        else:
+            lotes = [lista[i:i + tamanho_lote] for i in range(0, len(lista), tamanho_lote)]
+
+        for n, lote in enumerate(lotes):
+            cubo = np.stack([df.reindex(dates)[params].to_numpy(dtype=np.float64) for _, df in lote])
+            parciais = parciais_mensais(dates, cubo)
+            resultado = resample_parciais(parciais, params, dict_fcns, periodos)
+            cronometro.marca('agregacao')
+
+            for k, (lat_lon, _) in enumerate(lote):
+                point = (lat_lon[1], lat_lon[0])
+                save_parciais(point, parciais, foldername, k)
+                if not parquet:
+                    save(point, *dataFrames_parciais(parciais, resultado, k), foldername)
+
+            if parquet:
+                lat, lon = lote[0][0]
+                tile = f'{math.floor(lat / tamanho_tile)}_{math.floor(lon / tamanho_tile)}'
+                for periodo, (rotulos, valores) in resultado.items():
+                    bd_parquet.save_fragmento(
+                        foldername, periodo, tile, f'part-{inicio:%Y%m%d}-{fim:%Y%m%d}-{n}',
+                        [lat_lon for lat_lon, _ in lote], rotulos, valores, list(dict_fcns),
+                    )
+            cronometro.marca('gravacao')
+
+    return cronometro.tempos
+
+
+def junta_respostas(datas):
+    '''
+    Junta as respostas de get_nasa_point de trechos consecutivos (na ordem
+    das datas) em uma resposta só.
+    '''
+    ret = datas[0]
+    parametros = ret['properties']['parameter']
+    for data in datas[1:]:
+        for param, serie in data['properties']['parameter'].items():
+            parametros.setdefault(param, {}).update(serie)
+    return ret
+
+
+def processa_conteudo(lat_lon, conteudos, foldername, df_diario=None, agrega=True):
+    '''
+    processa a partir das respostas brutas (bytes) da NASA, uma por trecho
+    de datas, para que a leitura do json também rode fora do event loop (em
+    thread ou em outro processo).
+    '''
+    cronometro = Cronometro()
+    data = junta_respostas([json.loads(conteudo) for conteudo in conteudos])
+    cronometro.marca('leitura')
+    cronometro.soma(processa(lat_lon, data, foldername, df_diario, agrega))
+    return cronometro.tempos
+
+
+def processa_grupo_conteudos(pendentes, conteudos, foldername, agrega=True, celula=False):
+    '''
+    processa_grupo a partir das respostas brutas: regionais (uma por
+    parâmetro e trecho) ou, com "celula", as respostas do centro da célula
+    (uma por trecho).
+    '''
+    cronometro = Cronometro()
+    datas = [json.loads(conteudo) for conteudo in conteudos]
+    if celula:
+        datas = [{'features': [junta_respostas(datas)]}]
+    cronometro.marca('leitura')
+    cronometro.soma(processa_grupo(pendentes, datas, foldername, agrega))
+    return cronometro.tempos
+
+
+async def executa_thread(funcao, *args):
+    return await asyncio.get_running_loop().run_in_executor(None, funcao, *args)
+
+
+async def pipeline_async(session, lat_lon, start_date, end_date, foldername,
+                         cache=None, incremental=False, limitador=None, controle=None,
+                         agrega=True, executa=executa_thread, anos_trecho=1):
+    '''
+    Mesmo fluxo de pipeline, com o download no event loop e o processamento
+    (leitura do diário, pandas e gravação dos csv) em threads. O
+    processamento é entregue a "executa(funcao, *args)", que pode rodá-lo
+    em outro executor ou enfileirá-lo (ver download_pontos). O intervalo é
+    baixado em trechos de "anos_trecho" anos, em paralelo.
+    '''
+    loop = asyncio.get_running_loop()
+    plano = await loop.run_in_executor(
+        None, planeja_download, lat_lon, start_date, end_date, foldername, incremental
+    )
+    if plano is None:
+        return
+
+    start_date, end_date, df_diario = plano
+    conteudos = await get_nasa_point_trechos_async(
+        session, lat_lon, params, start_date, end_date, 'DAILY',
+        cache=cache, limitador=limitador, controle=controle, anos_trecho=anos_trecho,
+    )
+    await executa(processa_conteudo, lat_lon, conteudos, foldername, df_diario, agrega)
+
+
+def agrupa_tiles(points_lat_lon, tamanho_tile):
+    '''
+    Agrupa os pontos em tiles de "tamanho_tile" graus de lado.
+    '''
+    tiles = {}
+    for lat, lon in points_lat_lon:
+        chave = (math.floor(lat / tamanho_tile), math.floor(lon / tamanho_tile))
+        tiles.setdefault(chave, []).append((lat, lon))
+    return list(tiles.values())
+
+
+def bbox_tile(points_lat_lon, margem=0.5, lado_min=2.0):
+    '''
+    Caixa (lat_min, lat_max, lon_min, lon_max) que cobre os pontos, com
+    "margem" para incluir as células nativas vizinhas e lado mínimo exigido
+    pelo endpoint regional.
+    '''
+    lats = [lat for lat, _ in points_lat_lon]
+    lons = [lon for _, lon in points_lat_lon]
+    ret = []
+    for minimo, maximo in [(min(lats), max(lats)), (min(lons), max(lons))]:
+        minimo, maximo = minimo - margem, maximo + margem
+        falta = lado_min - (maximo - minimo)
+        if falta > 0:
+            minimo, maximo = minimo - falta / 2, maximo + falta / 2
+        ret += [round(minimo, 4), round(maximo, 4)]
+    return tuple(ret)
+
+
+def celula_nativa(lat_lon, resolucao=resolucao_nativa):
+    '''
+    Centro da célula da grade nativa da NASA que contém o ponto.
+    '''
+    lat, lon = lat_lon
+    return (round(round(lat / resolucao[0]) * resolucao[0], 4),
+            round(round(lon / resolucao[1]) * resolucao[1], 4))
+
+
+def agrupa_celulas(points_lat_lon):
+    '''
+    Agrupa os pontos que caem na mesma célula nativa: {célula: [pontos]}.
+    '''
+    celulas = {}
+    for point in points_lat_lon:
+        celulas.setdefault(celula_nativa(point), []).append(point)
+    return celulas
+
+
+def save_mapa_celulas(celulas, foldername):
+    df = pd.DataFrame(
+        [(lat, lon, celula[0], celula[1]) for celula, points in celulas.items() for lat, lon in points],
+        columns=['lat', 'lon', 'lat_celula', 'lon_celula'],
+    )
+    df.to_csv(f'{foldername}/celulas_nasa.csv', sep=';', index=False)
+
+
+def divide_regional(datas, points_lat_lon, starts):
+    '''
+    Separa as respostas regionais (uma por parâmetro e trecho de datas, com
+    os trechos na ordem das datas) em um "data" por ponto,
+    no mesmo formato de get_nasa_point, usando a célula nativa mais próxima
+    de cada ponto e apenas as datas a partir do "start" de cada ponto. Uma
+    resposta de get_nasa_point vale como região de uma célula só:
+    {'features': [data]}.
+    '''
+    lat = np.array([p[0] for p in points_lat_lon])
+    lon = np.array([p[1] for p in points_lat_lon])
+
+    ret = [{'geometry': {'coordinates': [p[1], p[0]]}, 'properties': {'parameter': {}}}
+           for p in points_lat_lon]
+
+    for data in datas:
+        features = data['features']
+        coords = np.array([f['geometry']['coordinates'][:2] for f in features])
+        d2 = (coords[None, :, 0] - lon[:, None])**2 + (coords[None, :, 1] - lat[:, None])**2
+        for i, j in enumerate(np.argmin(d2, axis=1)):
+            start = str(starts[i])
+            for param, serie in features[j]['properties']['parameter'].items():
+                ret[i]['properties']['parameter'].setdefault(param, {}).update(
+                    (k, v) for k, v in serie.items() if k >= start
+                )
+
+    return ret
+
+
+def processa_grupo(pendentes, datas, foldername, agrega=True):
+    points_lat_lon = [point for point, _ in pendentes]
+    starts = [plano[0] for _, plano in pendentes]
+    cronometro = Cronometro()
+    divididos = divide_regional(datas, points_lat_lon, starts)
+    cronometro.marca('leitura')
+    for (point, plano), data in zip(pendentes, divididos):
+        cronometro.soma(processa(point, data, foldername, plano[2], agrega))
+    return cronometro.tempos
+
+
+async def pipeline_regional_async(session, points_lat_lon, start_date, end_date, foldername,
+                                  cache=None, incremental=False, limitador=None, controle=None,
+                                  agrega=True, executa=executa_thread, anos_trecho=1):
+    '''
+    Mesmo fluxo de pipeline_async para um tile de pontos: uma requisição
+    regional por parâmetro, dividida depois entre os pontos do tile.
+    '''
+    loop = asyncio.get_running_loop()
+    planos = await loop.run_in_executor(None, lambda: [
+        planeja_download(point, start_date, end_date, foldername, incremental)
+        for point in points_lat_lon
+    ])
+    pendentes = [(point, plano) for point, plano in zip(points_lat_lon, planos) if plano is not None]
+    if len(pendentes) == 0:
+        return
+
+    conteudos = await get_nasa_regional_trechos_async(
+        session,
+        bbox_tile([point for point, _ in pendentes]),
+        params,
+        min(plano[0] for _, plano in pendentes),
+        max(plano[1] for _, plano in pendentes),
+        'DAILY',
+        cache=cache, limitador=limitador, controle=controle, anos_trecho=anos_trecho,
+    )
+    await executa(processa_grupo_conteudos, pendentes, conteudos, foldername, agrega)
+
+
+async def pipeline_celula_async(session, points_lat_lon, start_date, end_date, foldername,
+                                cache=None, incremental=False, limitador=None, controle=None,
+                                agrega=True, executa=executa_thread, anos_trecho=1):
+    '''
+    Mesmo fluxo de pipeline_async para pontos da mesma célula nativa: uma
+    única requisição, no centro da célula, repassada a todos os pontos.
+    '''
+    loop = asyncio.get_running_loop()
+    planos = await loop.run_in_executor(None, lambda: [
+        planeja_download(point, start_date, end_date, foldername, incremental)
+        for point in points_lat_lon
+    ])
+    pendentes = [(point, plano) for point, plano in zip(points_lat_lon, planos) if plano is not None]
+    if len(pendentes) == 0:
+        return
+
+    conteudos = await get_nasa_point_trechos_async(
+        session,
+        celula_nativa(points_lat_lon[0]),
+        params,
+        min(plano[0] for _, plano in pendentes),
+        max(plano[1] for _, plano in pendentes),
+        'DAILY',
+        cache=cache, limitador=limitador, controle=controle, anos_trecho=anos_trecho,
+    )
+    await executa(processa_grupo_conteudos, pendentes, conteudos, foldername, agrega, True)
+
+
+class MonitorEstagios:
+    '''
+    Acompanha o pipeline em estágios de download_pontos: grupos concluídos e
+    tempo gasto em cada estágio ('download' e 'processamento') e a
+    ocupação da fila entre eles, para verificar se a rede e os núcleos
+    estão saturados.
+    '''
+
+    def __init__(self):
+        self.inicio = time.monotonic()
+        self.estagios = {
+            'download': {'concluidos': 0, 'tempo': 0.0},
+            'processamento': {'concluidos': 0, 'tempo': 0.0},
+        }
+        self.fila_atual = 0
+        self.fila_max = 0
+        self._fila_soma = 0
+        self._fila_amostras = 0
+
+    def registra(self, estagio, tempo):
+        self.estagios[estagio]['concluidos'] += 1
+        self.estagios[estagio]['tempo'] += tempo
+
+    def amostra_fila(self, tamanho):
+        self.fila_atual = tamanho
+        self.fila_max = max(self.fila_max, tamanho)
+        self._fila_soma += tamanho
+        self._fila_amostras += 1
+
+    def resumo(self):
+        decorrido = max(time.monotonic() - self.inicio, 1e-9)
+        ret = {}
+        for estagio, aux in self.estagios.items():
+            n = aux['concluidos']
+            ret[estagio] = {
+                'concluidos': n,
+                'por_segundo': round(n / decorrido, 3),
+                'tempo_medio': round(aux['tempo'] / n, 3) if n > 0 else None,
+            }
+        ret['fila'] = {
+            'atual': self.fila_atual,
+            'max': self.fila_max,
+            'media': round(self._fila_soma / self._fila_amostras, 2) if self._fila_amostras > 0 else 0,
+        }
+        return ret
+
+
+def seleciona_pipeline(points_lat_lon, foldername, modo='ponto', tamanho_tile=9.0, deduplica=False):
+    '''
+    Grupos de pontos baixados juntos, pipeline de cada grupo e timeout da
+    sessão para o "modo" ('ponto' ou 'regional') de download_pontos.
+    '''
+    if modo.upper() == 'REGIONAL':
+        return agrupa_tiles(points_lat_lon, tamanho_tile), pipeline_regional_async, 600
+
+    if deduplica:
+        celulas = agrupa_celulas(points_lat_lon)
+        save_mapa_celulas(celulas, foldername)
+        return list(celulas.values()), pipeline_celula_async, 30
+
+    async def pipeline_grupo(session, grupo, *args, **kwargs):
+        await pipeline_async(session, grupo[0], *args, **kwargs)
+
+    return [[point] for point in points_lat_lon], pipeline_grupo, 30
+
+
+async def produz_downloads(session, fila, fila_processamento, pipeline_grupo, monitor,
+                           inicia, conclui, falhou, *args, **kwargs):
+    '''
+    Worker de download: baixa os grupos da "fila" e entrega o processamento
+    das respostas à "fila_processamento".
+    '''
+    while True:
+        item = await fila.get()
+        if item is None:
+            break
+        grupo, tentativa = item
+        inicia(grupo)
+
+        enfileirado = []
+
+        async def executa(funcao, *args_funcao):
+            monitor.registra('download', time.monotonic() - inicio)
+            enfileirado.append(True)
+            await fila_processamento.put((grupo, tentativa, funcao, args_funcao))
+            monitor.amostra_fila(fila_processamento.qsize())
+
+        inicio = time.monotonic()
+        try:
+            await pipeline_grupo(session, grupo, *args, executa=executa, **kwargs)
+        except Exception as e:
+            falhou(grupo, tentativa, e)
+            continue
+
+        # Nada a baixar para o grupo (modo incremental).
+        if len(enfileirado) == 0:
+            await conclui(grupo)
+
+
+async def consome_processamento(fila_processamento, executor, monitor, conclui, falhou):
+    '''
+    Worker de processamento: roda as funções da "fila_processamento" no
+    "executor" (None: threads).
+    '''
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await fila_processamento.get()
+        if item is None:
+            # Repassa o aviso de fim aos demais consumidores.
+            fila_processamento.put_nowait(None)
+            break
+        monitor.amostra_fila(fila_processamento.qsize())
+        grupo, tentativa, funcao, args = item
+
+        inicio = time.monotonic()
+        try:
+            tempos = await loop.run_in_executor(executor, funcao, *args)
+        except Exception as e:
+            falhou(grupo, tentativa, e)
+            continue
+        monitor.registra('processamento', time.monotonic() - inicio)
+        if api_nasa.telemetria is not None:
+            api_nasa.telemetria.registra_etapas(tempos)
+        await conclui(grupo)
+
+
+async def download_pontos(points_lat_lon, start_date, end_date, foldername,
+                          concorrencia=5, taxa_max=5.0, cache=None,
+                          incremental=False, tentativas=3, callback=None,
+                          controle=None, modo='ponto', tamanho_tile=9.0,
+                          deduplica=False, manifesto=None, agregacao='ponto',
+                          tamanho_lote=128, armazenamento='csv', processos=0,
+                          tamanho_fila=32, monitor=None, anos_trecho=1):
+    '''
+    Baixa e processa os pontos em dois estágios ligados por uma fila de até
+    "tamanho_fila" grupos: "concorrencia" workers de download (ver
+    seleciona_pipeline) e o processamento em threads ou em "processos".
+    Um grupo com erro volta para a fila até "tentativas" vezes.
+    Retorna a lista de (point, erro) que não foram concluídos.
+    '''
+    prepara_pastas(foldername)
+    agrega = agregacao.upper() != 'LOTE' and armazenamento.upper() != 'PARQUET'
+    points_todos = list(points_lat_lon)
+    if monitor is None:
+        monitor = MonitorEstagios()
+
+    if manifesto is not None:
+        payload_hash = ManifestoDownload.payload_hash(params, start_date, end_date)
+        pendentes = manifesto.pendentes(points_lat_lon, payload_hash, foldername)
+        if callback is not None:
+            for point in set(points_lat_lon) - set(pendentes):
+                callback(point, None)
+        points_lat_lon = pendentes
+
+    grupos, pipeline_grupo, timeout = seleciona_pipeline(
+        points_lat_lon, foldername, modo, tamanho_tile, deduplica,
+    )
+
+    fila = asyncio.Queue()
+    for grupo in grupos:
+        fila.put_nowait((grupo, 1))
+    fila_processamento = asyncio.Queue(maxsize=tamanho_fila)
+
+    limitador = LimitadorTaxa(taxa_max)
+    falhas = []
+    if controle is not None:
+        concorrencia = controle.maximo
+    n_consumidores = processos if processos > 0 else concorrencia
+    restantes = [len(grupos)]
+
+    def encerra_grupo():
+        # Grupo concluído ou sem mais tentativas: ao fim do último, libera os
+        # workers dos dois estágios.
+        restantes[0] -= 1
+        if restantes[0] == 0:
+            for _ in range(concorrencia):
+                fila.put_nowait(None)
+            fila_processamento.put_nowait(None)
+
+    def inicia(grupo):
+        if manifesto is not None:
+            for point in grupo:
+                manifesto.inicia(point, payload_hash)
+
+    async def conclui(grupo):
+        if manifesto is not None:
+            loop = asyncio.get_running_loop()
+            for point in grupo:
+                checksums = await loop.run_in_executor(
+                    None, checksums_arquivos, foldername, arquivos_ponto(point, agrega)
+                )
+                manifesto.conclui(point, checksums)
+
+        if callback is not None:
+            for point in grupo:
+                callback(point, None)
+        encerra_grupo()
+
+    def falhou(grupo, tentativa, e):
+        if manifesto is not None:
+            for point in grupo:
+                manifesto.falha(point, repr(e))
+        if tentativa < tentativas:
+            fila.put_nowait((grupo, tentativa + 1))
+        else:
+            falhas.extend((point, e) for point in grupo)
+        if callback is not None:
+            for point in grupo:
+                callback(point, e)
+        if tentativa >= tentativas:
+            encerra_grupo()
+
+    if len(grupos) == 0:
+        restantes[0] = 1
+        encerra_grupo()
+
+    executor = ProcessPoolExecutor(max_workers=processos) if processos > 0 else None
+
+    async with nova_sessao(concorrencia, timeout) as session:
+        try:
+            await asyncio.gather(
+                *(produz_downloads(
+                    session, fila, fila_processamento, pipeline_grupo, monitor,
+                    inicia, conclui, falhou, start_date, end_date, foldername,
+                    cache=cache, incremental=incremental,
+                    limitador=limitador, controle=controle, agrega=agrega,
+                    anos_trecho=anos_trecho,
+                ) for _ in range(concorrencia)),
+                *(consome_processamento(fila_processamento, executor, monitor, conclui, falhou)
+                  for _ in range(n_consumidores)),
+            )
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    if not agrega:
+        # Inclui os pontos que falharam: os datasets são refeitos do zero e o
+        # diário já salvo deles (de execuções anteriores) não pode se perder.
+        tempos = await asyncio.get_running_loop().run_in_executor(
+            None, processa_lote, points_todos, foldername, tamanho_lote, armazenamento, tamanho_tile,
+        )
+        if api_nasa.telemetria is not None:
+            api_nasa.telemetria.registra_etapas(tempos)
+
+    return falhas
@@ -0,0 +1,119 @@
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from shapely.geometry import Point
+
+
+# Nome do dataset de cada período, dentro da sub-pasta do período.
+nome_dataset = 'bd.parquet'
+
+
+def path_dataset(foldername, periodo):
+    return f'{foldername}/{periodo}/{nome_dataset}'
+
+
+def limpa_datasets(foldername, periodos):
+    for periodo in periodos:
+        shutil.rmtree(path_dataset(foldername, periodo), ignore_errors=True)
+
+
+def save_fragmento(foldername, periodo, tile, nome, points_lat_lon, rotulos, valores, colunas):
+    '''
+    Salva um fragmento do dataset do período: as linhas (data x ponto) dos
+    pontos de um lote, na partição "tile=<tile>". Os ids dos pontos
+    ("lon_lat", como os nomes dos csv) são codificados em dicionário e as
+    variáveis gravadas em float32.
+    '''
+    n_pontos, n_datas = valores.shape[:2]
+    ids = pa.DictionaryArray.from_arrays(
+        pa.array(np.repeat(np.arange(n_pontos, dtype=np.int32), n_datas)),
+        pa.array([f'{lon}_{lat}' for lat, lon in points_lat_lon]),
+    )
+    arrays = {
+        'date': pa.array(np.tile(rotulos.values.astype('datetime64[ms]'), n_pontos)),
+        'point': ids,
+        'lat': pa.array(np.repeat([lat for lat, _ in points_lat_lon], n_datas).astype(np.float64)),
+        'lon': pa.array(np.repeat([lon for _, lon in points_lat_lon], n_datas).astype(np.float64)),
+    }
+    for c, col in enumerate(colunas):
+        arrays[col] = pa.array(valores[:, :, c].reshape(-1).astype(np.float32))
+
+    folder = f'{path_dataset(foldername, periodo)}/tile={tile}'
+    os.makedirs(folder, exist_ok=True)
+    pq.write_table(pa.table(arrays), f'{folder}/{nome}.parquet', compression='zstd')
+
+
+def remove_datas_fragmento(filename, datas):
+    '''
+    Remove de um fragmento as linhas das "datas" (apaga o arquivo se não
+    sobrar nenhuma).
+    '''
+    tabela = pq.read_table(filename)
+    datas = pa.array(pd.DatetimeIndex(datas).values.astype('datetime64[ms]'))
+    tabela = tabela.filter(pc.invert(pc.is_in(tabela['date'], value_set=datas)))
+    if tabela.num_rows == 0:
+        os.remove(filename)
+    else:
+        pq.write_table(tabela, filename, compression='zstd')
+
+
+def save_pontos(df, foldername):
+    '''
+    Tabela dos pontos (id, lat, lon e envelope em WKT), salva uma única vez,
+    fora dos datasets dos períodos.
+    '''
+    tabela = pd.DataFrame({
+        'point': [f'{pt.x}_{pt.y}' for pt in df['center_point']],
+        'lat': [pt.y for pt in df['center_point']],
+        'lon': [pt.x for pt in df['center_point']],
+    })
+    if 'envelope' in df.columns:
+        tabela['envelope'] = [str(env) for env in df['envelope']]
+    tabela.to_parquet(f'{foldername}/pontos.parquet', index=False)
+
+
+def colunas_dataset(path):
+    return ds.dataset(path, format='parquet', partitioning='hive').schema.names
+
+
+def read_bd_parquet(path, columns=None, date_initial=None, date_final=None):
+    '''
+    Lê o dataset de um período no mesmo formato do "compactado.csv": índice
+    de datas, variáveis, "center_point" (shapely) e "envelope" (WKT, quando
+    existe "pontos.parquet" na pasta do BD). Lê apenas as colunas em
+    "columns" e as datas em [date_initial, date_final) (aaaammdd).
+    '''
+    dataset = ds.dataset(path, format='parquet', partitioning='hive')
+
+    filtro = None
+    if date_initial is not None:
+        filtro = ds.field('date') >= pd.to_datetime(str(date_initial), format='%Y%m%d')
+    if date_final is not None:
+        aux = ds.field('date') < pd.to_datetime(str(date_final), format='%Y%m%d')
+        filtro = aux if filtro is None else filtro & aux
+
+    cols = ['date', 'point', 'lat', 'lon']
+    if columns is not None:
+        cols += [col for col in columns if col not in cols]
+    else:
+        cols += [col for col in dataset.schema.names if col not in cols + ['tile']]
+
+    df = dataset.to_table(columns=cols, filter=filtro).to_pandas()
+    df = df.set_index('date')
+    df.index.name = None
+    df['point'] = df['point'].astype(str)
+
+    df['center_point'] = [Point(lon, lat) for lon, lat in zip(df['lon'], df['lat'])]
+
+    filename_pontos = os.path.join(os.path.dirname(os.path.dirname(os.path.normpath(path))), 'pontos.parquet')
+    if os.path.isfile(filename_pontos):
+        pontos = pd.read_parquet(filename_pontos, columns=['point', 'envelope'])
+        df['envelope'] = df['point'].map(dict(zip(pontos['point'], pontos['envelope'])))
+
+    return df.drop(columns=['point', 'lat', 'lon'])
@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Dict, Union
+
+
+class CacheNasa:
+    '''
+    Cache local, em disco, das respostas da API da NASA POWER.
+
+    Cada resposta é salva compactada (gzip) em um arquivo cujo nome é o hash
+    do payload normalizado da requisição. Quando o tamanho total excede
+    "tamanho_max" (bytes), as entradas acessadas há mais tempo são removidas
+    (LRU). Requisições cuja data final está nos últimos "dias_recentes" dias
+    expiram após "ttl_recentes" segundos, pois a NASA ainda pode atualizar
+    esses dados.
+    '''
+
+    def __init__(self,
+                 foldername: str,
+                 tamanho_max: int = 2 * 1024**3,
+                 ttl_recentes: Union[float, None] = 7 * 24 * 3600,
+                 dias_recentes: int = 90):
+        self.foldername = foldername
+        self.tamanho_max = tamanho_max
+        self.ttl_recentes = ttl_recentes
+        self.dias_recentes = dias_recentes
+
+        self.hits = 0
+        self.misses = 0
+        self.expirados = 0
+        self.removidos = 0
+
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._tamanho = 0
+
+        os.makedirs(foldername, exist_ok=True)
+        self._carregar_indice()
+
+    def _carregar_indice(self):
+        # Ordena as entradas existentes pela data do último acesso (mtime).
+        arquivos = []
+        for raiz, _, nomes in os.walk(self.foldername):
+            for nome in nomes:
+                if nome.endswith('.json.gz'):
+                    st = os.stat(os.path.join(raiz, nome))
+                    arquivos.append((st.st_mtime, nome[:-len('.json.gz')], st.st_size))
+
+        for _, chave, tamanho in sorted(arquivos):
+            self._entradas[chave] = tamanho
+            self._tamanho += tamanho
+
+    @staticmethod
+    def chave(link: str, payload: Dict) -> str:
+        normalizado = {k: str(v) for k, v in payload.items() if k != 'user'}
+        if 'parameters' in normalizado:
+            normalizado['parameters'] = ','.join(sorted(normalizado['parameters'].split(',')))
+        texto = json.dumps({'link': link, 'payload': normalizado}, sort_keys=True)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def _filename(self, chave: str) -> str:
+        return os.path.join(self.foldername, chave[:2], f'{chave}.json.gz')
+
+    def _recente(self, payload: Dict) -> bool:
+        try:
+            end = datetime.strptime(str(payload['end']), '%Y%m%d').date()
+        except (KeyError, ValueError):
+            return False
+        return end >= date.today() - timedelta(days=self.dias_recentes)
+
+    def _remover(self, chave: str):
+        tamanho = self._entradas.pop(chave, 0)
+        self._tamanho -= tamanho
+        try:
+            os.remove(self._filename(chave))
+        except FileNotFoundError:
+            pass
+
+    def get(self, link: str, payload: Dict) -> Union[Dict, None]:
+        conteudo = self.get_raw(link, payload)
+        if conteudo is None:
+            return None
+        return json.loads(conteudo)
+
+    def get_raw(self, link: str, payload: Dict) -> Union[bytes, None]:
+        chave = self.chave(link, payload)
+        filename = self._filename(chave)
+
+        with self._lock:
+            if chave not in self._entradas:
+                self.misses += 1
+                return None
+
+            try:
+                with gzip.open(filename, 'rb') as f:
+                    conteudo = f.read()
+                    criado = f.mtime
+            except (OSError, EOFError):
+                self._remover(chave)
+                self.misses += 1
+                return None
+
+            if (self.ttl_recentes is not None and self._recente(payload)
+                    and time.time() - criado > self.ttl_recentes):
+                self._remover(chave)
+                self.expirados += 1
+                self.misses += 1
+                return None
+
+            self._entradas.move_to_end(chave)
+            os.utime(filename)
+            self.hits += 1
+
+        return conteudo
+
+    def put(self, link: str, payload: Dict, conteudo: bytes):
+        chave = self.chave(link, payload)
+        filename = self._filename(chave)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+
+        dados = gzip.compress(conteudo, mtime=time.time())
+        tmp = f'{filename}.{threading.get_ident()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(dados)
+        os.replace(tmp, filename)
+
+        with self._lock:
+            if chave in self._entradas:
+                self._tamanho -= self._entradas[chave]
+            self._entradas[chave] = len(dados)
+            self._entradas.move_to_end(chave)
+            self._tamanho += len(dados)
+
+            while self._tamanho > self.tamanho_max and len(self._entradas) > 1:
+                antiga = next(iter(self._entradas))
+                self._remover(antiga)
+                self.removidos += 1
+
+    def resumo(self) -> Dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'expirados': self.expirados,
+            'removidos': self.removidos,
+            'entradas': len(self._entradas),
+            'tamanho': self._tamanho,
+        }
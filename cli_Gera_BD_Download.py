@@ -1,15 +1,24 @@
 
 # os.environ['USE_PYGEOS'] = '0'
 
+import os
+import sys
 import click
+import asyncio
+import numpy as np
 import pandas as pd
 
-from time import sleep
 from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor
 
 from utils import read_geo_generico
-from backend import pipeline
+from backend import MonitorEstagios, download_pontos, periodos
+import bd_parquet
+import api_nasa
+from api_nasa import ControleConcorrencia
+from cache_nasa import CacheNasa
+from manifesto import ManifestoDownload
+from telemetria import Telemetria
 
 # ==============================================================================
 # =========================== Parâmetros default ===============================
@@ -19,24 +28,71 @@ foldername_output_dft = './dados/BD_6_pontos'
 date_initial_dft = 20120101
 date_final_dft = 20221230
 verbose_dft = 'False'
+foldername_cache_dft = ''
+cache_tamanho_max_dft = 2048
+incremental_dft = 'False'
+concorrencia_dft = 5
+concorrencia_max_dft = 20
+modo_download_dft = 'ponto'
+tamanho_tile_dft = 9.0
+url_api_dft = api_nasa.url_api
+deduplica_dft = 'False'
+retoma_dft = 'False'
+agregacao_dft = 'ponto'
+armazenamento_dft = 'csv'
+processos_dft = 0
+tamanho_fila_dft = 32
+anos_trecho_dft = 1
+taxa_max_dft = 5.0
 # ==============================================================================
 
-def compacta_bd(df, foldername):
-    df_compacto = None
-    for _, row in df.iterrows():
+def compacta_bd(df, foldername, max_workers=16):
+    '''
+    Junta os csv de todos os pontos da pasta em um único DataFrame. Os
+    arquivos são lidos em paralelo e concatenados de uma vez só;
+    "center_point" e "envelope" são categóricos (uma geometria por ponto,
+    não por linha). Pontos sem csv na pasta (download que falhou) são
+    ignorados, com um aviso.
+    '''
+    names_file = [f"{ponto.x}_{ponto.y}" for ponto in df['center_point']]
+    existe = np.array([os.path.isfile(f'{foldername}/{name_file}.csv') for name_file in names_file], dtype=bool)
+    for name_file in sorted(set(np.array(names_file, dtype=object)[~existe])):
+        print(f'Aviso: {foldername}/{name_file}.csv não existe; ponto fora do compactado.')
+    if not existe.all():
+        df = df.loc[existe]
+        names_file = [name_file for name_file, ok in zip(names_file, existe) if ok]
+    if len(names_file) == 0:
+        return pd.DataFrame()
+    codigos, _ = pd.factorize(pd.Series(names_file))
+
+    def ler(name_file):
+        return pd.read_csv(f'{foldername}/{name_file}.csv', index_col=0)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        dfs = list(executor.map(ler, names_file))
+
+    df_compacto = pd.concat(dfs)
+    codigos_linhas = np.repeat(codigos, [len(aux) for aux in dfs])
+
+    primeiros = np.unique(codigos, return_index=True)[1]
+    for col in ['center_point', 'envelope']:
+        categorias = pd.Index(list(df[col].iloc[primeiros]), dtype=object)
+        df_compacto[col] = pd.Categorical.from_codes(codigos_linhas, categories=categorias)
 
-        name_file = f"{row['center_point'].x}_{row['center_point'].y}.csv"
-        df = pd.read_csv(f'{foldername}/{name_file}', index_col=0)
+    return df_compacto
 
-        df['center_point'] = row['center_point']
-        df['envelope'] = row['envelope']
 
-        if df_compacto is None:
-            df_compacto = df.copy()
-        else:
-            df_compacto = pd.concat([df_compacto, df])
+def compacta_periodos(df, foldername_output, armazenamento=armazenamento_dft):
+    '''
+    Um DataFrame por período (mensal, ..., histórico) com todos os pontos de
+    "df": lidos do dataset colunar ('parquet') ou compactados dos csv.
+    '''
+    if armazenamento.upper() == 'PARQUET':
+        bd_parquet.save_pontos(df, foldername_output)
+        return tuple(bd_parquet.read_bd_parquet(bd_parquet.path_dataset(foldername_output, periodo))
+                     for periodo in periodos)
 
-    return df_compacto
+    return tuple(compacta_bd(df, f'{foldername_output}/{periodo}') for periodo in periodos)
 
 
 
@@ -46,12 +102,41 @@ def execute_gera_bd_download(
         date_initial,
         date_final,
         verbose, 
+        foldername_cache=foldername_cache_dft,
+        cache_tamanho_max=cache_tamanho_max_dft,
+        incremental=incremental_dft,
+        concorrencia=concorrencia_dft,
+        taxa_max=taxa_max_dft,
+        concorrencia_max=concorrencia_max_dft,
+        modo_download=modo_download_dft,
+        tamanho_tile=tamanho_tile_dft,
+        url_api=url_api_dft,
+        deduplica=deduplica_dft,
+        retoma=retoma_dft,
+        agregacao=agregacao_dft,
+        armazenamento=armazenamento_dft,
+        processos=processos_dft,
+        tamanho_fila=tamanho_fila_dft,
+        anos_trecho=anos_trecho_dft,
 ):
+    '''
+    Retorna os seis períodos compactados e a lista de (point, erro) dos
+    pontos que não foram baixados; esses pontos ficam fora do compactado.
+    '''
     # Trata verbose...
     def depuracao(texto):
         if verbose.upper() == 'TRUE':
             print(texto)
 
+    api_nasa.url_api = url_api
+    telemetria = Telemetria()
+    api_nasa.telemetria = telemetria
+
+    cache = None
+    if len(foldername_cache) > 0:
+        depuracao('(execute_gera_bd_download)\n Abrir cache local das respostas da NASA...')
+        cache = CacheNasa(foldername_cache, tamanho_max=cache_tamanho_max * 1024**2)
+
     depuracao('(execute_gera_bd_download)\n Ler pontos de entrada...')
     try:
         df = read_geo_generico(
@@ -66,58 +151,74 @@ def execute_gera_bd_download(
 
     depuracao('(execute_gera_bd_download)\n Executa download...')
     points_lat_lon = [(ponto.y, ponto.x) for ponto in df['center_point']]
-    with ThreadPoolExecutor(5) as pool:
-
-        futures = [
-            (
-                point, 
-                pool.submit(
-                    pipeline, 
-                    lat_lon=point, 
-                    start_date=date_initial, 
-                    end_date=date_final,
-                    foldername=foldername_output,
-                )
-            )
-            for point in points_lat_lon
-        ]
+    if verbose.upper() == 'TRUE':
+        pbar = tqdm(total=len(points_lat_lon))
+
+    monitor = MonitorEstagios()
 
+    def callback(point, e):
         if verbose.upper() == 'TRUE':
-            pbar = tqdm(total=len(points_lat_lon))
-
-        for point, future in futures:
-            while not future.done:
-                sleep(0.5)
-
-            e = future.exception()
-            if e:
-                if verbose.upper() == 'TRUE':
-                    pbar.write(str(e))
-                f = pool.submit(
-                    pipeline, 
-                    lat_lon=point, 
-                    start_date=date_initial, 
-                    end_date=date_final,
-                    foldername=foldername_output,
-                )
-                futures.append((point, f))
+            if e is not None:
+                pbar.write(f'{point}: {e}')
             else:
-                if verbose.upper() == 'TRUE':
-                    pbar.update()
+                pbar.update()
+                pbar.set_postfix(fila=monitor.fila_atual)
 
-        if verbose.upper() == 'TRUE':
-            pbar.close()
+    manifesto = None
+    if retoma.upper() == 'TRUE':
+        os.makedirs(foldername_output, exist_ok=True)
+        manifesto = ManifestoDownload(f'{foldername_output}/manifesto.sqlite')
+
+    controle = None
+    if concorrencia_max > concorrencia:
+        controle = ControleConcorrencia(inicial=concorrencia, maximo=concorrencia_max)
+
+    falhas = asyncio.run(download_pontos(
+        points_lat_lon,
+        date_initial,
+        date_final,
+        foldername_output,
+        concorrencia=concorrencia,
+        taxa_max=taxa_max,
+        cache=cache,
+        incremental=incremental.upper() == 'TRUE',
+        callback=callback,
+        controle=controle,
+        modo=modo_download,
+        tamanho_tile=tamanho_tile,
+        deduplica=deduplica.upper() == 'TRUE',
+        manifesto=manifesto,
+        agregacao=agregacao,
+        armazenamento=armazenamento,
+        processos=processos,
+        tamanho_fila=tamanho_fila,
+        monitor=monitor,
+        anos_trecho=anos_trecho,
+    ))
+
+    if verbose.upper() == 'TRUE':
+        pbar.close()
+
+    for point, e in falhas:
+        print(f'Não foi possível baixar o ponto {point}.\n{str(e)}')
+
+    if cache is not None:
+        depuracao(f'(execute_gera_bd_download)\n Cache: {cache.resumo()}')
+    if controle is not None:
+        depuracao(f'(execute_gera_bd_download)\n Concorrência: {controle.resumo()}')
+    depuracao(f'(execute_gera_bd_download)\n Estágios: {monitor.resumo()}')
+    depuracao(f'(execute_gera_bd_download)\n Telemetria: {telemetria.resumo()}')
+    telemetria.salva(foldername_output)
+    api_nasa.telemetria = None
+    if manifesto is not None:
+        depuracao(f'(execute_gera_bd_download)\n Manifesto: {manifesto.resumo()}')
+        manifesto.close()
 
     depuracao('(execute_gera_bd_download)\n Compactação de arquivos em arquivo único...')
-    df_mes = compacta_bd(df, f'{foldername_output}/mensal')
-    df_bim = compacta_bd(df, f'{foldername_output}/bimestral')
-    df_tri = compacta_bd(df, f'{foldername_output}/trimestral')
-    df_sem = compacta_bd(df, f'{foldername_output}/semestral')
-    df_ano = compacta_bd(df, f'{foldername_output}/anual')
-    df_his = compacta_bd(df, f'{foldername_output}/histórico')
+    df_mes, df_bim, df_tri, df_sem, df_ano, df_his = compacta_periodos(df, foldername_output, armazenamento)
 
     depuracao('(execute_gera_bd_download)\n Concluído!')
-    return df_mes, df_bim, df_tri, df_sem, df_ano, df_his
+    return df_mes, df_bim, df_tri, df_sem, df_ano, df_his, falhas
 
 
 
@@ -146,12 +247,23 @@ def execute_gera_bd_download(
         "bimestral", 
         "trimestral", 
         "semestral",
-        "anual" e 
-        "histórico". 
+        "anual", 
+        "histórico", 
+        "diário" (série diária limpa, em binário compacto ".npz", usada pelo 
+        modo incremental e por "cli_Reagrega_BD.py", que recalcula os 
+        períodos sem acessar a NASA) e 
+        "parciais" (soma, contagem, mínimo e máximo de cada mês, de onde 
+        são calculados os demais períodos). 
 
         Em cada uma dessa sub-pastas e para cada ponto de interesse, há um 
         arquivo com dados daquele ponto gegdaláfico. 
         
+        Na pasta de saída também fica o relatório da execução: 
+        "telemetria.json" (latência das requisições, bytes, status, 
+        retentativas, tempo de espera e tempo de cada etapa do 
+        processamento) e "telemetria_requisicoes.csv" (uma linha por 
+        requisição).
+
         Em cada sub-pasta, há um arquivo extra nomeado de "compactado.csv",
         em que as colunas são as variáveis de interesse obtidas da NASA e as 
         linhas são os valores referentes a cada um dos pontos.
@@ -182,12 +294,188 @@ def execute_gera_bd_download(
     default=verbose_dft, 
     help='Flag que habilita impressão de detalhes da execução.',
 )
+@click.option(
+    '--foldername_cache', 
+    default=foldername_cache_dft, 
+    help='''
+        Pasta do cache local das respostas da NASA. Requisições repetidas 
+        (mesmo ponto, parâmetros e datas) são lidas do disco, sem acesso à 
+        Internet. Vazio desabilita o cache.
+
+        Exemplo: "./dados/cache_nasa"
+    ''',
+)
+@click.option(
+    '--cache_tamanho_max', 
+    default=cache_tamanho_max_dft, 
+    help='''
+        Tamanho máximo do cache, em MB. Ao ultrapassar, as respostas usadas 
+        há mais tempo são removidas.
+    ''',
+)
+@click.option(
+    '--incremental', 
+    default=incremental_dft, 
+    help='''
+        Flag que habilita o download incremental: para cada ponto já salvo 
+        em "foldername_output", baixa apenas as datas que faltam no diário 
+        e recalcula somente os períodos atingidos.
+    ''',
+)
+@click.option(
+    '--concorrencia', 
+    default=concorrencia_dft, 
+    help='''
+        Número inicial de requisições simultâneas à NASA. As conexões são 
+        reaproveitadas (keep-alive) entre requisições.
+    ''',
+)
+@click.option(
+    '--concorrencia_max', 
+    default=concorrencia_max_dft, 
+    help='''
+        Número máximo de requisições simultâneas. Se maior que 
+        "concorrencia", o número de requisições cresce enquanto a NASA 
+        responde bem e cai pela metade em respostas 429/503/504 ou timeouts.
+        Se menor ou igual, a concorrência fica fixa.
+    ''',
+)
+@click.option(
+    '--taxa_max', 
+    default=taxa_max_dft, 
+    help='''
+        Número máximo de requisições por segundo, somando todas as conexões.
+    ''',
+)
+@click.option(
+    '--modo_download', 
+    default=modo_download_dft, 
+    help='''
+        'ponto': uma requisição à NASA por ponto de interesse.
+
+        'regional': agrupa os pontos em tiles e faz uma requisição regional 
+        por tile e variável; cada ponto recebe a série da célula da grade 
+        nativa da NASA mais próxima.
+    ''',
+)
+@click.option(
+    '--tamanho_tile', 
+    default=tamanho_tile_dft, 
+    help='''
+        Lado dos tiles do modo regional, em graus (a NASA aceita regiões de 
+        2 a 10 graus).
+    ''',
+)
+@click.option(
+    '--url_api', 
+    default=url_api_dft, 
+    help='''
+        Endereço da API diária da NASA POWER. Permite usar um servidor local 
+        para testes.
+
+        Exemplo: "http://localhost:8765/api/temporal/daily"
+    ''',
+)
+@click.option(
+    '--deduplica', 
+    default=deduplica_dft, 
+    help='''
+        Flag que, no modo 'ponto', associa cada ponto à célula da grade 
+        nativa da NASA (0.5° x 0.625°) e baixa cada célula uma única vez, 
+        repassando a série a todos os seus pontos. A tabela ponto -> célula 
+        é salva em "celulas_nasa.csv", na pasta de saída.
+    ''',
+)
+@click.option(
+    '--retoma', 
+    default=retoma_dft, 
+    help='''
+        Flag que habilita a retomada de execuções interrompidas: o andamento 
+        de cada ponto é registrado em "manifesto.sqlite", na pasta de saída, 
+        e os pontos já concluídos (mesmas datas e arquivos íntegros) não são 
+        baixados de novo.
+
+        Desligada por padrão, como as demais flags de reaproveitamento: sem 
+        ela, todos os pontos são baixados e nenhum manifesto é gravado.
+    ''',
+)
+@click.option(
+    '--agregacao', 
+    default=agregacao_dft, 
+    help='''
+        'ponto': os períodos de cada ponto são calculados logo após o seu 
+        download.
+
+        'lote': durante o download só é salva a série diária; ao final, os 
+        períodos de todos os pontos são calculados de uma vez, de forma 
+        vetorizada (mais rápido para muitos pontos).
+    ''',
+)
+@click.option(
+    '--armazenamento', 
+    default=armazenamento_dft, 
+    help='''
+        'csv': um arquivo por ponto e período, e o "compactado.csv" de cada 
+        período.
+
+        'parquet': um dataset colunar por período, "<período>/bd.parquet", 
+        particionado em tiles de pontos, com variáveis em float32 e ids dos 
+        pontos codificados em dicionário; a tabela dos pontos fica em 
+        "pontos.parquet". Não gera os csv por ponto nem o "compactado.csv" 
+        (implica agregação em lote). Os datasets podem ser usados 
+        diretamente como entrada das etapas seguintes.
+    ''',
+)
+@click.option(
+    '--processos', 
+    default=processos_dft, 
+    help='''
+        Número de processos do estágio de processamento (leitura do json, 
+        limpeza, agregação e gravação), separado do download: os downloads 
+        alimentam uma fila consumida por esses processos. Com 0, o 
+        processamento roda em threads do próprio processo.
+    ''',
+)
+@click.option(
+    '--tamanho_fila', 
+    default=tamanho_fila_dft, 
+    help='''
+        Máximo de respostas baixadas aguardando processamento. Com a fila 
+        cheia, os downloads esperam.
+    ''',
+)
+@click.option(
+    '--anos_trecho', 
+    default=anos_trecho_dft, 
+    help='''
+        Tamanho, em anos do calendário, dos trechos em que o intervalo de 
+        datas de cada requisição é dividido. Os trechos são baixados em 
+        paralelo e só os que falham são repetidos. Com 0, cada ponto é 
+        baixado em uma requisição só.
+    ''',
+)
 def cli_execute_gera_bd_download(
         filename_input, 
         foldername_output,
         date_initial,
         date_final,
         verbose, 
+        foldername_cache,
+        cache_tamanho_max,
+        incremental,
+        concorrencia,
+        taxa_max,
+        concorrencia_max,
+        modo_download,
+        tamanho_tile,
+        url_api,
+        deduplica,
+        retoma,
+        agregacao,
+        armazenamento,
+        processos,
+        tamanho_fila,
+        anos_trecho,
 ):
     # Trata verbose...
     def depuracao(texto):
@@ -201,21 +489,46 @@ def cli_execute_gera_bd_download(
     depuracao(f'{date_initial = }')
     depuracao(f'{date_final = }')
     depuracao(f'{verbose = }')
+    depuracao(f'{foldername_cache = }')
+    depuracao(f'{cache_tamanho_max = }')
+    depuracao(f'{incremental = }')
+    depuracao(f'{concorrencia = }')
+    depuracao(f'{taxa_max = }')
+    depuracao(f'{concorrencia_max = }')
+    depuracao(f'{modo_download = }')
+    depuracao(f'{tamanho_tile = }')
+    depuracao(f'{url_api = }')
+    depuracao(f'{deduplica = }')
+    depuracao(f'{retoma = }')
+    depuracao(f'{agregacao = }')
+    depuracao(f'{armazenamento = }')
+    depuracao(f'{processos = }')
+    depuracao(f'{tamanho_fila = }')
+    depuracao(f'{anos_trecho = }')
     depuracao(f'-----\n')
 
-    df_mes, df_bim, df_tri, df_sem, df_ano, df_his = execute_gera_bd_download(
-        filename_input, foldername_output, date_initial, date_final, verbose
+    df_mes, df_bim, df_tri, df_sem, df_ano, df_his, falhas = execute_gera_bd_download(
+        filename_input, foldername_output, date_initial, date_final, verbose,
+        foldername_cache, cache_tamanho_max, incremental, concorrencia, taxa_max,
+        concorrencia_max, modo_download, tamanho_tile, url_api,
+        deduplica, retoma, agregacao, armazenamento, processos, tamanho_fila,
+        anos_trecho,
     )
 
     depuracao('(cli_execute_gera_bd_download)\n Amostra do arquivo histórico gerado:')
     depuracao(df_his.head())
 
-    df_mes.to_csv(f'{foldername_output}/mensal/compactado.csv', sep=';', date_format='%Y%m%d')
-    df_bim.to_csv(f'{foldername_output}/bimestral/compactado.csv', sep=';', date_format='%Y%m%d')
-    df_tri.to_csv(f'{foldername_output}/trimestral/compactado.csv', sep=';', date_format='%Y%m%d')
-    df_sem.to_csv(f'{foldername_output}/semestral/compactado.csv', sep=';', date_format='%Y%m%d')
-    df_ano.to_csv(f'{foldername_output}/anual/compactado.csv', sep=';', date_format='%Y%m%d')
-    df_his.to_csv(f'{foldername_output}/histórico/compactado.csv', sep=';', date_format='%Y%m%d')
+    if armazenamento.upper() != 'PARQUET':
+        df_mes.to_csv(f'{foldername_output}/mensal/compactado.csv', sep=';', date_format='%Y%m%d')
+        df_bim.to_csv(f'{foldername_output}/bimestral/compactado.csv', sep=';', date_format='%Y%m%d')
+        df_tri.to_csv(f'{foldername_output}/trimestral/compactado.csv', sep=';', date_format='%Y%m%d')
+        df_sem.to_csv(f'{foldername_output}/semestral/compactado.csv', sep=';', date_format='%Y%m%d')
+        df_ano.to_csv(f'{foldername_output}/anual/compactado.csv', sep=';', date_format='%Y%m%d')
+        df_his.to_csv(f'{foldername_output}/histórico/compactado.csv', sep=';', date_format='%Y%m%d')
+
+    if len(falhas) > 0:
+        print(f'{len(falhas)} ponto(s) não baixado(s).')
+        sys.exit(1)
 
     depuracao('Concluído!')
 
@@ -3,18 +3,20 @@
 
 import click
 import os
-import math
+import uuid
+import numpy as np
 import pandas as pd
-import openturns as ot
 import matplotlib.pyplot as plt
 
 import geopandas as gpd
 from shapely import wkt
-from shapely.geometry import MultiPoint
-from shapely.ops import nearest_points
 
 from utils import read_geo_generico
 from backend import dict_fcns
+import bd_parquet
+from bd_parquet import read_bd_parquet
+from manifesto import ManifestoInterpolacao
+from interpolacao import InterpolacaoParalela, coordenadas, interpola_cubo, matriz_grade, matriz_idw
 
 # ==============================================================================
 # =========================== Parâmetros default ===============================
@@ -31,96 +33,106 @@ foldername_output_figures_dft = ''
 date_output_figures_dft = -1
 turnon_grid_interpolado_in_figures_dft = 'True'
 verbose_dft = 'False'
+foldername_cache_dft = ''
+processos_dft = 0
+armazenamento_dft = 'csv'
+datas_por_bloco_dft = 64
+incremental_dft = 'False'
 # ==============================================================================
 
 
 
-def interpolate_idw(pt, df_vizinhos, cols, p):
-
-    ret = {}
-    for col in cols:
-
-        numerador = 0
-        denominador = 0
-
-        for _, row in df_vizinhos.iterrows():
-
-            ponto_vizinho = row['center_point']
-            dx = ((pt.x - ponto_vizinho.x) * math.pi) / 180 # long em rad
-            dy = ((pt.y - ponto_vizinho.y) * math.pi) / 180 # lat em rad
-
-            a = math.sin(dy/2) * math.sin(dy/2) + math.cos((pt.y)/2) * math.cos((ponto_vizinho.y)/2) * pow(math.sin(dx/2),2)
-            distance = 6378.1 * 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-
-            valor = float(row[col])
-            numerador += (valor/distance**p)
-            denominador += (1/distance**p)
-
-        ret[col] = numerador/denominador
-
-    return ret
-
-def interpolate_kriging(point, df_vizinhos, cols):
-    # https://openturns.github.io/openturns/1.17/auto_meta_modeling/kriging_metamodel/plot_kriging_beam_trend.html?highlight=krigingalgorithm
-    # https://stackoverflow.com/questions/45175201/how-can-i-interpolate-station-data-with-kriging-in-python
-
-    ret = {}
-    for col in cols:
-
-        xy_train = [[pt.x, pt.y] for pt in df_vizinhos['center_point']]
-        value_train = [[float(valor)] for valor in df_vizinhos[col]]
-
-        # for _, row in df_vizinhos.iterrows():
-
-        #     ponto_vizinho = row['center_point']
-        #     xy_train.append([ponto_vizinho.x,ponto_vizinho.y])
-        #     value_train.append([float(row[col])])
-
-        # Fit
-        inputDimension = 2
-        basis = ot.ConstantBasisFactory(inputDimension).build()
-
-        # Modelo de covariância exponencial, uma vez que a precipitação deve ser 
-        # regular em relação a localidade do ponto.
-        covarianceModel = ot.SquaredExponential([1.] * inputDimension, [1.0])
-
-        algo = ot.KrigingAlgorithm(xy_train, value_train, covarianceModel, basis)
-        algo.run()
-        result = algo.getResult()
-        krigingMetamodel = result.getMetaModel()
-
-        ret[col] = krigingMetamodel([point.x,point.y])[0]
-
-    return ret
-
-def get_nearest_points(center_point, df_dados, neighbors):
-
-    base_de_pontos = list(df_dados['center_point'].copy())
+def frame_interpolado(datas, valores, pontos, envelopes, cols):
+    '''
+    Resultado (datas x alvos x variáveis) de interpola_cubo no formato do
+    DataFrame de saída (date, center_point, envelope e variáveis): uma
+    linha por data e ponto, na ordem do grid.
+    '''
+    n_datas, n_alvos = valores.shape[:2]
+    df = pd.DataFrame({
+        'date': pd.DatetimeIndex(datas).repeat(n_alvos),
+        'center_point': np.tile(pontos, n_datas),
+        'envelope': np.tile(envelopes, n_datas),
+    })
+    for c, col in enumerate(cols):
+        df[col] = valores[:, :, c].reshape(-1)
+    return df
 
-    ret = [False] * len(df_dados.index)
-    for i in range(neighbors):
-        aux = nearest_points(center_point, MultiPoint(base_de_pontos))
-        ponto_mais_proximo = aux[1]
-        if ponto_mais_proximo not in ret:
-            flag = [(ponto_mais_proximo == pt) for pt in df_dados['center_point']]
-            if sum(flag) != 1:
-                print('Erro em get_nearest_points: ocorrências diferente de 1.')
-            else:
-                ret = [a or b for a, b in zip(ret, flag)]
-                base_de_pontos.remove(ponto_mais_proximo)
 
-    return df_dados.loc[ret]
+def frame_ids(datas, valores, ids, cols):
+    '''
+    Como frame_interpolado, mas com o id de cada ponto ("point", ver
+    save_pontos_csv) no lugar das geometrias: formato das linhas do csv de
+    saída.
+    '''
+    n_datas, n_alvos = valores.shape[:2]
+    df = pd.DataFrame({
+        'date': pd.DatetimeIndex(datas).repeat(n_alvos),
+        'point': np.tile(ids, n_datas),
+    })
+    for c, col in enumerate(cols):
+        df[col] = valores[:, :, c].reshape(-1)
+    return df
 
-def interpolar_point(date, center_point, envelope, df_dados, algorithm, idw_p, neighbors):
 
-    df_vizinhos = get_nearest_points(center_point, df_dados, neighbors)
-    if algorithm.upper() == 'IDW':
-        aux = interpolate_idw(center_point, df_vizinhos, list(dict_fcns.keys()), idw_p)
-    elif algorithm.upper() == 'KRIGING':
-        aux = interpolate_kriging(center_point, df_vizinhos, list(dict_fcns.keys()))
+def save_pontos_csv(df, filename):
+    '''
+    Tabela dos pontos do csv de saída (id, lat, lon, "center_point" e
+    "envelope"), gravada uma única vez; as linhas do csv se referem a ela
+    pelo id ("point", no formato de bd_parquet.save_pontos).
+    '''
+    tabela = pd.DataFrame({
+        'point': [f'{pt.x}_{pt.y}' for pt in df['center_point']],
+        'lat': [pt.y for pt in df['center_point']],
+        'lon': [pt.x for pt in df['center_point']],
+        'center_point': [pt.wkt for pt in df['center_point']],
+    })
+    if 'envelope' in df.columns:
+        tabela['envelope'] = [str(env) for env in df['envelope']]
+    tabela.to_csv(filename, sep=';', index=False)
+    return tabela['point'].to_numpy()
+
+
+def mescla_csv(filename, datas_removidas, frames):
+    '''
+    Regrava o csv de saída (ordenado por data) sem as linhas de
+    "datas_removidas" e com as linhas dos "frames" (DataFrames de
+    frame_ids, em ordem de data) intercaladas por data. Lê e grava em
+    partes.
+    '''
+    filename_tmp = f'{filename}.{os.getpid()}.tmp'
+    linhas = 0
+
+    def escreve(df):
+        nonlocal linhas
+        df.index = pd.RangeIndex(linhas, linhas + len(df))
+        df.to_csv(filename_tmp, sep=';', date_format='%Y%m%d', mode='w' if linhas == 0 else 'a', header=linhas == 0)
+        linhas += len(df)
+
+    frames = iter(frames)
+    proximo = next(frames, None)
+    for antigo in pd.read_csv(filename, sep=';', index_col=0, chunksize=200000, float_precision='round_trip'):
+        antigo['date'] = pd.to_datetime(antigo['date'].astype(str), format='%Y%m%d')
+        antigo = antigo.loc[~antigo['date'].isin(datas_removidas)]
+        if len(antigo) == 0:
+            continue
+
+        ultima = antigo['date'].iloc[-1]
+        partes = [antigo]
+        while proximo is not None and proximo['date'].iloc[0] <= ultima:
+            partes.append(proximo.loc[proximo['date'] <= ultima])
+            resto = proximo.loc[proximo['date'] > ultima]
+            proximo = resto if len(resto) > 0 else next(frames, None)
+        escreve(pd.concat(partes).sort_values('date', kind='stable'))
+
+    while proximo is not None:
+        escreve(proximo)
+        proximo = next(frames, None)
+
+    if linhas == 0:
+        pd.DataFrame().to_csv(filename_tmp, sep=';')
+    os.replace(filename_tmp, filename)
 
-    ret = {'date': date, 'center_point': center_point, 'envelope': envelope}
-    return {**ret, **aux}
 
 def salvar_figures_date(date, df_dados, df_interpolado, cols, foldername_output, flag, verbose):
     '''
@@ -250,12 +262,37 @@ def execute_gera_bd_interpolado(
         date_output_figures,
         turnon_grid_interpolado_in_figures,
         verbose, 
+        foldername_cache=foldername_cache_dft,
+        processos=processos_dft,
+        filename_output='',
+        armazenamento=armazenamento_dft,
+        datas_por_bloco=datas_por_bloco_dft,
+        incremental=incremental_dft,
 ):
+    '''
+    Sem "filename_output", retorna o DataFrame com todos os pontos
+    interpolados. Com ele, grava os resultados à medida que são gerados, de
+    "datas_por_bloco" em "datas_por_bloco" datas, e retorna None:
+
+    - 'csv': uma linha por data e ponto, com o id do ponto ("point") no
+      lugar das geometrias, e a tabela dos pontos (geometrias, uma vez) em
+      "<filename_output>.pontos.csv" (ver save_pontos_csv).
+    - 'parquet': pasta "filename_output" com "pontos.parquet" (geometrias,
+      uma vez) e o dataset "interpolado/bd.parquet" (data, ponto e
+      variáveis), no formato dos períodos do download.
+
+    As datas gravadas ficam registradas em um manifesto (ver
+    ManifestoInterpolacao). Com "incremental" 'True', interpola apenas as
+    datas novas ou cujos dados mudaram e as mescla à saída existente.
+    '''
     # Trata verbose...
     def depuracao(texto):
         if verbose.upper() == 'TRUE':
             print(texto)
 
+    if algorithm.upper() not in ('IDW', 'KRIGING', 'KRIGING_GLOBAL', 'BILINEAR', 'BICUBIC'):
+        return print(f'Algoritmo de interpolação desconhecido: {algorithm}.')
+
     depuracao('(execute_gera_bd_interpolado)\n Ler pontos de entrada para serem interpolados...')
     try:
         df_grid_interpolado = read_geo_generico(
@@ -270,12 +307,27 @@ def execute_gera_bd_interpolado(
 
     depuracao('(execute_gera_bd_interpolado)\n Ler pontos de entrada com os dados de referência...')
     try:
-        df_grid_dados = read_geo_generico(
-            filename_input_grid_dados, 
-            geometry_label='center_point', 
-            sep=';', 
-            verbose=verbose
-        )
+        if filename_input_grid_dados.endswith('.parquet'):
+            # Dataset colunar gerado pelo download: lê apenas as variáveis e as
+            # datas usadas (incluindo a data dos gráficos).
+            datas = [int(date_initial), int(date_final)]
+            if len(foldername_output_figures) > 0:
+                dia_seguinte = pd.to_datetime(str(date_output_figures), format='%Y%m%d') + pd.Timedelta(days=1)
+                datas += [int(date_output_figures), int(dia_seguinte.strftime('%Y%m%d'))]
+            df_grid_dados = read_bd_parquet(
+                filename_input_grid_dados, 
+                columns=list(dict_fcns.keys()), 
+                date_initial=min(datas), 
+                date_final=max(datas),
+            )
+            df_grid_dados = gpd.GeoDataFrame(df_grid_dados, geometry='center_point', crs='epsg:4618')
+        else:
+            df_grid_dados = read_geo_generico(
+                filename_input_grid_dados, 
+                geometry_label='center_point', 
+                sep=';', 
+                verbose=verbose
+            )
 
         # Atenção
         # =======
@@ -290,34 +342,192 @@ def execute_gera_bd_interpolado(
     date = pd.to_datetime(date_initial, format='%Y%m%d')
     date_fim = pd.to_datetime(date_final, format='%Y%m%d')
 
-    list_interpolados = []
-    while date < date_fim:
-        flag = (df_grid_dados.index == date)
-
-        if sum(flag) > 0:
-            dff_grid_dados = df_grid_dados.loc[flag]
-            for idx, row in df_grid_interpolado.iterrows():
-                aux = interpolar_point(
-                    date, 
-                    row['center_point'], 
-                    row['envelope'],
-                    dff_grid_dados, 
-                    algorithm, 
-                    idw_p, 
-                    neighbors,
-                )
-                list_interpolados.append(aux)
-        date = date + pd.DateOffset(1)
+    cols = list(dict_fcns.keys())
+    lons_alvo, lats_alvo = coordenadas(df_grid_interpolado['center_point'])
+
+    pontos = np.empty(len(df_grid_interpolado), dtype=object)
+    pontos[:] = list(df_grid_interpolado['center_point'])
+    envelopes = np.empty(len(df_grid_interpolado), dtype=object)
+    envelopes[:] = list(df_grid_interpolado['envelope'])
+
+    # Dados do intervalo ordenados por data (ordenação estável: mantém a
+    # ordem dos pontos em cada data), de modo que cada data é uma fatia
+    # contígua; percorre só as datas que existem nos dados.
+    dff_periodo = df_grid_dados.loc[(df_grid_dados.index >= date) & (df_grid_dados.index < date_fim)]
+    dff_periodo = dff_periodo.iloc[np.argsort(dff_periodo.index.values, kind='stable')]
+    datas_dados, inicios = np.unique(dff_periodo.index.values, return_index=True)
+    fins = np.append(inicios[1:], len(dff_periodo))
+    lons_dados, lats_dados = coordenadas(dff_periodo['center_point'])
+    valores_dados = dff_periodo[cols].to_numpy(dtype=np.float64)
+
+    # As datas consecutivas com o mesmo conjunto de pontos com dados formam
+    # um bloco, interpolado de uma vez como um cubo (datas x pontos x
+    # variáveis): vizinhos e pesos são calculados uma vez por bloco.
+    blocos = []
+    coords_base = None
+    for date, inicio, fim in zip(pd.DatetimeIndex(datas_dados), inicios, fins):
+        coords = (lons_dados[inicio:fim], lats_dados[inicio:fim])
+        if coords_base is None or not all(np.array_equal(a, b) for a, b in zip(coords, coords_base)):
+            coords_base = coords
+            blocos.append((coords, [], []))
+        blocos[-1][1].append(date)
+        blocos[-1][2].append((inicio, fim))
+
+    manifesto = None
+    if len(filename_output) > 0:
+        if armazenamento.upper() == 'PARQUET':
+            os.makedirs(filename_output, exist_ok=True)
+            manifesto = ManifestoInterpolacao(f'{filename_output}/manifesto.sqlite')
+            existe = os.path.isdir(bd_parquet.path_dataset(filename_output, 'interpolado'))
+        else:
+            manifesto = ManifestoInterpolacao(f'{filename_output}.manifesto.sqlite')
+            existe = os.path.isfile(filename_output) and os.path.isfile(f'{filename_output}.pontos.csv')
+
+        hash_config = ManifestoInterpolacao.config_hash(lons_alvo, lats_alvo, algorithm, neighbors, idw_p, cols)
+        hashes = {
+            date: ManifestoInterpolacao.dados_hash(lons_dados[inicio:fim], lats_dados[inicio:fim], valores_dados[inicio:fim])
+            for date, inicio, fim in zip(pd.DatetimeIndex(datas_dados), inicios, fins)
+        }
+
+        # A saída só é reaproveitada se foi gerada com a mesma configuração.
+        registradas = manifesto.registradas()
+        reaproveita = (
+            incremental.upper() == 'TRUE' and existe and len(registradas) > 0 
+            and all(config == hash_config for _, config, _ in registradas.values())
+        )
+        if not reaproveita:
+            manifesto.limpa()
+            registradas = {}
+
+        pendentes = {
+            date for date, hash_dados in hashes.items() 
+            if registradas.get(date.strftime('%Y%m%d'), (None,))[0] != hash_dados
+        }
+        alteradas = sorted(date for date in pendentes if date.strftime('%Y%m%d') in registradas)
+        depuracao(f'(execute_gera_bd_interpolado)\n Datas a interpolar: {len(pendentes)} de {len(hashes)} ({len(alteradas)} alteradas).')
+
+        blocos = [
+            (coords, [d for d in datas if d in pendentes], [f for d, f in zip(datas, fatias) if d in pendentes])
+            for coords, datas, fatias in blocos
+        ]
+        blocos = [bloco for bloco in blocos if len(bloco[1]) > 0]
+
+    paralela = None
+    if processos > 0 and len(blocos) > 0:
+        depuracao(f'(execute_gera_bd_interpolado)\n Interpolação em {processos} processos...')
+        paralela = InterpolacaoParalela(processos, valores_dados, lons_dados, lats_dados, lons_alvo, lats_alvo, neighbors)
+
+    def interpola_bloco(coords, fatias, matriz):
+        if paralela is not None:
+            return paralela.interpola(algorithm, fatias, matriz)
+        cubo = np.stack([valores_dados[i:f] for i, f in fatias])
+        return interpola_cubo(algorithm, cubo, *coords, lons_alvo, lats_alvo, neighbors, matriz)
+
+    def gera_interpolados():
+        # (datas, valores (datas x alvos x variáveis)), em partes de até
+        # "datas_por_bloco" datas, para limitar a memória.
+        for coords, datas, fatias in blocos:
+            matriz = None
+            if algorithm.upper() in ('BILINEAR', 'BICUBIC'):
+                matriz = matriz_grade(*coords, lons_alvo, lats_alvo, algorithm, neighbors, idw_p, foldername_cache)
+                if matriz is None:
+                    depuracao('(execute_gera_bd_interpolado)\n Pontos com dados fora de uma grade regular: usa IDW.')
+            if matriz is None and algorithm.upper() in ('IDW', 'BILINEAR', 'BICUBIC'):
+                matriz = matriz_idw(*coords, lons_alvo, lats_alvo, neighbors, idw_p, foldername_cache)
+            for k in range(0, len(fatias), datas_por_bloco):
+                yield datas[k:k + datas_por_bloco], interpola_bloco(coords, fatias[k:k + datas_por_bloco], matriz)
+
+    date_figures = None
+    if len(foldername_output_figures) > 0:
+        date_figures = pd.to_datetime(date_output_figures, format='%Y%m%d')
 
-    df = pd.DataFrame(list_interpolados)
+    try:
+        if len(filename_output) == 0:
+            frames = [
+                frame_interpolado(datas, valores, pontos, envelopes, cols)
+                for datas, valores in gera_interpolados()
+            ]
+            df = pd.concat(frames, ignore_index=True) if len(frames) > 0 else pd.DataFrame()
+            df_figures = df
+
+        elif armazenamento.upper() == 'PARQUET':
+            depuracao(f'(execute_gera_bd_interpolado)\n Gravação em partes: {filename_output}')
+            path = bd_parquet.path_dataset(filename_output, 'interpolado')
+            if not reaproveita:
+                bd_parquet.limpa_datasets(filename_output, ['interpolado'])
+            else:
+                # Retira as datas alteradas dos fragmentos em que estão.
+                fragmentos = {}
+                for date in alteradas:
+                    fragmentos.setdefault(registradas[date.strftime('%Y%m%d')][2], []).append(date)
+                for fragmento, datas in fragmentos.items():
+                    if os.path.isfile(f'{path}/{fragmento}'):
+                        bd_parquet.remove_datas_fragmento(f'{path}/{fragmento}', datas)
+                manifesto.remove([date.strftime('%Y%m%d') for date in alteradas])
+            bd_parquet.save_pontos(df_grid_interpolado, filename_output)
+            points_lat_lon = list(zip(lats_alvo, lons_alvo))
+
+            # Nomes únicos por execução: fragmentos de execuções anteriores
+            # são mantidos no modo incremental.
+            execucao = uuid.uuid4().hex[:8]
+            df, df_figures = None, pd.DataFrame()
+            for n, (datas, valores) in enumerate(gera_interpolados()):
+                nome = f'part-{execucao}-{n:05d}'
+                bd_parquet.save_fragmento(
+                    filename_output, 'interpolado', 0, nome, 
+                    points_lat_lon, pd.DatetimeIndex(datas), valores.transpose(1, 0, 2), cols,
+                )
+                manifesto.registra(
+                    [date.strftime('%Y%m%d') for date in datas], [hashes[date] for date in datas], 
+                    hash_config, f'tile=0/{nome}.parquet',
+                )
+                if date_figures in datas:
+                    df_figures = frame_interpolado(datas, valores, pontos, envelopes, cols)
+
+        else:
+            depuracao(f'(execute_gera_bd_interpolado)\n Gravação em partes: {filename_output}')
+            df, df_figures = None, pd.DataFrame()
+            ids = save_pontos_csv(df_grid_interpolado, f'{filename_output}.pontos.csv')
+
+            def gera_frames():
+                nonlocal df_figures
+                for datas, valores in gera_interpolados():
+                    if date_figures in datas:
+                        df_figures = frame_interpolado(datas, valores, pontos, envelopes, cols)
+                    yield datas, frame_ids(datas, valores, ids, cols)
+
+            if reaproveita:
+                manifesto.remove([date.strftime('%Y%m%d') for date in alteradas])
+                mescla_csv(filename_output, alteradas, (aux for _, aux in gera_frames()))
+                datas = sorted(pendentes)
+                manifesto.registra([date.strftime('%Y%m%d') for date in datas], [hashes[date] for date in datas], hash_config)
+            else:
+                linhas = 0
+                for datas, aux in gera_frames():
+                    aux.index = pd.RangeIndex(linhas, linhas + len(aux))
+                    aux.to_csv(
+                        filename_output, 
+                        sep=';', 
+                        date_format='%Y%m%d', 
+                        mode='w' if linhas == 0 else 'a', 
+                        header=linhas == 0,
+                    )
+                    linhas += len(aux)
+                    manifesto.registra([date.strftime('%Y%m%d') for date in datas], [hashes[date] for date in datas], hash_config)
+                if linhas == 0:
+                    pd.DataFrame().to_csv(filename_output, sep=';')
+    finally:
+        if paralela is not None:
+            paralela.close()
+        if manifesto is not None:
+            manifesto.close()
 
     if len(foldername_output_figures) > 0:
         depuracao('(execute_gera_bd_interpolado)\n Gerar gráficos...')
-        date = pd.to_datetime(date_output_figures, format='%Y%m%d')
         salvar_figures_date(
-            date, 
+            date_figures, 
             df_grid_dados, 
-            df, 
+            df_figures, 
             list(dict_fcns.keys()), 
             foldername_output_figures, 
             turnon_grid_interpolado_in_figures,
@@ -353,6 +563,10 @@ def execute_gera_bd_interpolado(
 
         A primeira coluna deve ter datas no formato aaaammdd.
 
+        Também aceita o dataset colunar de um período gerado pelo download 
+        (".../<período>/bd.parquet"), do qual são lidas apenas as variáveis 
+        e as datas usadas.
+
         Exemplo: "C:/Projeto/Resultados/input_grid_dados.csv"
     ''',
 )
@@ -364,6 +578,9 @@ def execute_gera_bd_interpolado(
 
         Separador: ";".
 
+        No csv, cada linha tem o id do ponto ("point"); as geometrias ficam 
+        em "<saída>.pontos.csv" (ver "armazenamento").
+
         Exemplo: "C:/Projeto/Resultados/output_grid_interpolação.csv"
     ''',
 )
@@ -371,7 +588,20 @@ def execute_gera_bd_interpolado(
     '--algorithm', 
     default=algorithm_dft, 
     help='''
-        Algoritmo de interpolação: 'KRIGING' ou 'IDW'
+        Algoritmo de interpolação: 'IDW', 'KRIGING', 'KRIGING_GLOBAL', 
+        'BILINEAR' ou 'BICUBIC'.
+
+        'KRIGING': krigagem local, com os "neighbors" vizinhos de cada ponto 
+        (um ajuste por variável e conjunto de vizinhos).
+
+        'KRIGING_GLOBAL': krigagem com todos os pontos com dados; o modelo de 
+        cada variável é ajustado uma vez e aplicado a todas as datas e pontos.
+
+        'BILINEAR' e 'BICUBIC': para pontos com dados em grade regular (como 
+        os do download, gerados por cli_Gera_Grid), a célula de cada ponto é 
+        calculada diretamente; pontos fora da grade ou com nós faltando usam 
+        IDW, assim como grades irregulares.
+
         Exemplo: IDW
     ''',
 )
@@ -424,6 +654,63 @@ def execute_gera_bd_interpolado(
     default=verbose_dft, 
     help='Flag que habilita impressão de detalhes da execução.',
 )
+@click.option(
+    '--foldername_cache', 
+    default=foldername_cache_dft, 
+    help='''
+        Pasta do cache das matrizes de pesos do IDW. A matriz depende só dos 
+        pontos com dados, dos pontos a interpolar, de "neighbors" e de 
+        "idw_p", e é reaproveitada por outras datas e períodos (mensal, 
+        anual, ...). Vazio desabilita o cache.
+
+        Exemplo: "./dados/cache_interpolacao"
+    ''',
+)
+@click.option(
+    '--processos', 
+    default=processos_dft, 
+    help='''
+        Número de processos da interpolação. Os dados de referência ficam em 
+        memória compartilhada e o trabalho é dividido por datas (IDW), 
+        variáveis (KRIGING_GLOBAL) ou pontos a interpolar (KRIGING); o 
+        resultado é o mesmo da execução serial. Com 0, roda no próprio 
+        processo.
+    ''',
+)
+@click.option(
+    '--armazenamento', 
+    default=armazenamento_dft, 
+    help='''
+        'csv': "filename_output_grid_interpolado" é um csv com uma linha por 
+        data e ponto (data, id do ponto em "point" e variáveis) e 
+        "<saída>.pontos.csv" é a tabela dos pontos (id, lat, lon, 
+        "center_point" e "envelope"), gravada uma vez.
+
+        'parquet': "filename_output_grid_interpolado" é uma pasta com 
+        "pontos.parquet" (geometrias dos pontos, gravadas uma vez) e o dataset 
+        "interpolado/bd.parquet" (data, ponto e variáveis), no formato dos 
+        períodos do download.
+
+        Em ambos, os resultados são gravados à medida que são interpolados.
+    ''',
+)
+@click.option(
+    '--datas_por_bloco', 
+    default=datas_por_bloco_dft, 
+    help='Número de datas interpoladas e gravadas de cada vez (limita a memória).',
+)
+@click.option(
+    '--incremental', 
+    default=incremental_dft, 
+    help='''
+        Flag que reaproveita a saída existente: as datas gravadas ficam 
+        registradas em um manifesto ("<saída>.manifesto.sqlite" no csv, 
+        "manifesto.sqlite" na pasta do parquet), com o hash dos dados de 
+        origem de cada data e da configuração (pontos a interpolar, algoritmo 
+        e parâmetros). Interpola apenas as datas novas ou cujos dados mudaram 
+        e as mescla à saída. Com outra configuração, regrava tudo.
+    ''',
+)
 def cli_execute_gera_bd_interpolado(
         filename_input_grid_interpolado, 
         filename_input_grid_dados,
@@ -437,6 +724,11 @@ def cli_execute_gera_bd_interpolado(
         date_output_figures,
         turnon_grid_interpolado_in_figures,
         verbose, 
+        foldername_cache,
+        processos,
+        armazenamento,
+        datas_por_bloco,
+        incremental,
 ):
     # Trata verbose...
     def depuracao(texto):
@@ -457,9 +749,14 @@ def cli_execute_gera_bd_interpolado(
     depuracao(f'{date_output_figures = }')
     depuracao(f'{turnon_grid_interpolado_in_figures = }')
     depuracao(f'{verbose = }')
+    depuracao(f'{foldername_cache = }')
+    depuracao(f'{processos = }')
+    depuracao(f'{armazenamento = }')
+    depuracao(f'{datas_por_bloco = }')
+    depuracao(f'{incremental = }')
     depuracao(f'-----\n')
 
-    df_interpolado = execute_gera_bd_interpolado(
+    execute_gera_bd_interpolado(
         filename_input_grid_interpolado, 
         filename_input_grid_dados, 
         algorithm,
@@ -471,15 +768,12 @@ def cli_execute_gera_bd_interpolado(
         date_output_figures,
         turnon_grid_interpolado_in_figures,
         verbose, 
-    )
-
-    depuracao('(cli_execute_gera_bd_interpolado)\n Amostra do arquivo interpolado gerado:')
-    depuracao(df_interpolado.head())
-
-    df_interpolado.to_csv(
-        filename_output_grid_interpolado, 
-        sep=';', 
-        date_format='%Y%m%d',
+        foldername_cache,
+        processos,
+        filename_output_grid_interpolado,
+        armazenamento,
+        datas_por_bloco,
+        incremental,
     )
 
     depuracao('Concluído!')
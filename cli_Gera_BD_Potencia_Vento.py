@@ -10,6 +10,7 @@ from concurrent.futures import ThreadPoolExecutor
 
 from utils import read_geo_generico
 from backend import pipeline
+from bd_parquet import colunas_dataset, read_bd_parquet
 
 # ==============================================================================
 # =========================== Parâmetros default ===============================
@@ -44,7 +45,13 @@ def execute_gera_bd_potencia_vento(
 
     depuracao('(execute_gera_bd_potencia_vento)\n Ler dados de entrada...')
 
-    df = pd.read_csv(filename_input, sep=';', index_col=0)
+    if filename_input.endswith('.parquet'):
+        # Dataset colunar gerado pelo download: lê apenas a coluna de vento.
+        if column_input not in colunas_dataset(filename_input):
+            return print(f'"{column_input}" não pertence ao arquivo de entrada.')
+        df = read_bd_parquet(filename_input, columns=[column_input])
+    else:
+        df = pd.read_csv(filename_input, sep=';', index_col=0)
     if column_input not in df.columns:
         return print(f'"{column_input}" não pertence ao arquivo de entrada.')
 
@@ -66,6 +73,9 @@ def execute_gera_bd_potencia_vento(
     help='''
         Nome do arquivo de entrada em que consta a coluna de velocidade de vento.
 
+        Também aceita o dataset colunar de um período gerado pelo download 
+        (".../<período>/bd.parquet"), do qual é lida apenas essa coluna.
+
         Exemplo: "C:/Projeto/Resultados/dados_pb.csv"
     ''',
 )
@@ -0,0 +1,151 @@
+
+# os.environ['USE_PYGEOS'] = '0'
+
+import click
+
+from utils import read_geo_generico
+from backend import periodos, prepara_pastas, processa_lote
+from cli_Gera_BD_Download import compacta_periodos
+
+# ==============================================================================
+# =========================== Parâmetros default ===============================
+# ==============================================================================
+filename_input_dft = './dados/input_gera_bd_download_com_6_pontos.csv'
+foldername_output_dft = './dados/BD_6_pontos'
+armazenamento_dft = 'csv'
+tamanho_lote_dft = 128
+verbose_dft = 'False'
+# ==============================================================================
+
+
+
+def execute_reagrega_bd(
+        filename_input,
+        foldername_output,
+        armazenamento,
+        tamanho_lote,
+        verbose,
+):
+    # Trata verbose...
+    def depuracao(texto):
+        if verbose.upper() == 'TRUE':
+            print(texto)
+
+    depuracao('(execute_reagrega_bd)\n Ler pontos de entrada...')
+    try:
+        df = read_geo_generico(
+            filename_input,
+            index_col=False,
+            geometry_label='center_point',
+            sep=';',
+            verbose=verbose
+        )
+    except Exception as e:
+        return print(f'Não foi possível ler o arquivo de entrada.\n{str(e)}')
+
+    depuracao('(execute_reagrega_bd)\n Recalcula os períodos a partir dos diários salvos...')
+    prepara_pastas(foldername_output)
+    points_lat_lon = [(ponto.y, ponto.x) for ponto in df['center_point']]
+    processa_lote(points_lat_lon, foldername_output, tamanho_lote, armazenamento)
+
+    depuracao('(execute_reagrega_bd)\n Compactação de arquivos em arquivo único...')
+    df_mes, df_bim, df_tri, df_sem, df_ano, df_his = compacta_periodos(df, foldername_output, armazenamento)
+
+    depuracao('(execute_reagrega_bd)\n Concluído!')
+    return df_mes, df_bim, df_tri, df_sem, df_ano, df_his
+
+
+
+@click.command()
+@click.option(
+    '--filename_input',
+    default=filename_input_dft,
+    help='''
+        Nome do arquivo gegdaláfico com os pontos do BD (o mesmo usado no
+        download).
+
+        Se o arquivo é csv, a separação deve ser com ";".
+
+        Os pontos de interesse devem estar em uma coluna nomeada de "center_point".
+
+        Exemplo: "C:/Projeto/Resultados/input_gera_bd_download.csv"
+    ''',
+)
+@click.option(
+    '--foldername_output',
+    default=foldername_output_dft,
+    help='''
+        Nome da pasta do BD gerado pelo download. Os períodos ("mensal", ...,
+        "histórico") e os "compactado.csv" são recalculados a partir das
+        séries diárias salvas na sub-pasta "diário", sem acessar a NASA.
+
+        Exemplo: "C:/Projeto/Resultados"
+    ''',
+)
+@click.option(
+    '--armazenamento',
+    default=armazenamento_dft,
+    help='''
+        'csv': um arquivo por ponto e período, e o "compactado.csv" de cada
+        período.
+
+        'parquet': um dataset colunar por período, "<período>/bd.parquet".
+    ''',
+)
+@click.option(
+    '--tamanho_lote',
+    default=tamanho_lote_dft,
+    help='Número de pontos agregados de uma vez.',
+)
+@click.option(
+    '--verbose',
+    default=verbose_dft,
+    help='Flag que habilita impressão de detalhes da execução.',
+)
+def cli_execute_reagrega_bd(
+        filename_input,
+        foldername_output,
+        armazenamento,
+        tamanho_lote,
+        verbose,
+):
+    # Trata verbose...
+    def depuracao(texto):
+        if verbose.upper() == 'TRUE':
+            print(texto)
+
+    depuracao(f'')
+    depuracao(f'Resumo dos parâmetros recebidos:\n')
+    depuracao(f'{filename_input = }')
+    depuracao(f'{foldername_output = }')
+    depuracao(f'{armazenamento = }')
+    depuracao(f'{tamanho_lote = }')
+    depuracao(f'{verbose = }')
+    depuracao(f'-----\n')
+
+    dfs = execute_reagrega_bd(
+        filename_input,
+        foldername_output,
+        armazenamento,
+        tamanho_lote,
+        verbose,
+    )
+
+    depuracao('(cli_execute_reagrega_bd)\n Amostra do arquivo histórico gerado:')
+    depuracao(dfs[-1].head())
+
+    if armazenamento.upper() != 'PARQUET':
+        for periodo, df in zip(periodos, dfs):
+            df.to_csv(f'{foldername_output}/{periodo}/compactado.csv', sep=';', date_format='%Y%m%d')
+
+    depuracao('Concluído!')
+
+
+
+if __name__ == '__main__':
+    cli_execute_reagrega_bd()
+
+
+# Exemplo de uso:
+# (ambiente_virtual) caminho>
+# python cli_Reagrega_BD.py --filename_input "./dados/input_gera_bd_download_pb.csv" --foldername_output "./dados/BD_PB" --verbose True
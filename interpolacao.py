@@ -0,0 +1,540 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+import openturns as ot
+from scipy import sparse
+from scipy.linalg import LinAlgError, cho_factor, cho_solve
+from scipy.spatial import cKDTree
+
+
+# Raio da Terra (km) usado nas distâncias.
+raio_terra = 6378.1
+
+
+def _xyz(lons, lats):
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def coordenadas(pontos):
+    '''
+    (lons, lats) de uma sequência de pontos shapely.
+    '''
+    pontos = list(pontos)
+    return np.array([pt.x for pt in pontos]), np.array([pt.y for pt in pontos])
+
+
+class IndiceVizinhos:
+    '''
+    Índice espacial dos pontos de origem, para buscar os k vizinhos mais
+    próximos (distância de grande círculo) de vários pontos de uma vez.
+
+    Os pontos são levados à esfera unitária (x, y, z): a distância
+    euclidiana entre eles (corda) cresce com a distância de grande círculo,
+    então uma KD-tree nessas coordenadas dá os mesmos vizinhos, com busca
+    O(log N) por ponto.
+    '''
+
+    def __init__(self, lons, lats):
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self._arvore = cKDTree(_xyz(self.lons, self.lats))
+
+    def __len__(self):
+        return len(self.lons)
+
+    def consulta(self, lons, lats, k):
+        '''
+        Vizinhos dos pontos (lons, lats): (distâncias em km, índices), ambos
+        (pontos x k), do mais próximo ao mais distante. "k" é limitado ao
+        número de pontos de origem.
+        '''
+        k = min(k, len(self))
+        corda, indices = self._arvore.query(_xyz(lons, lats), k=k)
+        corda = np.asarray(corda, dtype=np.float64).reshape(len(indices), k)
+        indices = np.asarray(indices).reshape(len(corda), k)
+        distancias = 2 * raio_terra * np.arcsin(np.minimum(corda / 2, 1.0))
+        return distancias, indices
+
+
+def distancias_idw(lons_alvo, lats_alvo, lons, lats):
+    '''
+    Distâncias (km) entre cada ponto alvo e seus vizinhos, com a fórmula
+    original do IDW deste projeto (cos de lat/2, em graus, na haversine),
+    mantida para não mudar os resultados. "lons"/"lats": (alvos x k).
+    '''
+    lons_alvo = np.asarray(lons_alvo, dtype=np.float64)[:, None]
+    lats_alvo = np.asarray(lats_alvo, dtype=np.float64)[:, None]
+    dx = ((lons_alvo - lons) * np.pi) / 180
+    dy = ((lats_alvo - lats) * np.pi) / 180
+
+    a = np.sin(dy / 2)**2 + np.cos(lats_alvo / 2) * np.cos(lats / 2) * np.sin(dx / 2)**2
+    return raio_terra * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def pesos_idw(distancias, p):
+    '''
+    Pesos normalizados (alvos x k) do IDW: 1/d^p. Um alvo que coincide com
+    um vizinho (d = 0) recebe o valor desse vizinho.
+    '''
+    coincide = distancias == 0
+    with np.errstate(divide='ignore'):
+        pesos = 1 / distancias**p
+    linhas = coincide.any(axis=1)
+    pesos[linhas] = coincide[linhas]
+    return pesos / pesos.sum(axis=1, keepdims=True)
+
+
+def chave_pesos(lons_origem, lats_origem, lons_alvo, lats_alvo, neighbors, idw_p):
+    '''
+    Hash das coordenadas dos pontos de origem e alvo (na ordem em que
+    aparecem) e dos parâmetros do IDW: identifica a matriz de pesos.
+    '''
+    h = hashlib.sha256()
+    for coords in (lons_origem, lats_origem, lons_alvo, lats_alvo):
+        h.update(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+        h.update(b'|')
+    h.update(f'neighbors={neighbors};idw_p={idw_p}'.encode('utf-8'))
+    return h.hexdigest()
+
+
+def matriz_idw(lons_origem, lats_origem, lons_alvo, lats_alvo, neighbors, idw_p, foldername_cache=''):
+    '''
+    Matriz esparsa (alvos x pontos de origem) com os pesos normalizados do
+    IDW: cada linha tem os "neighbors" vizinhos do alvo.
+
+    Os pesos só dependem dos dois grids e dos parâmetros; com
+    "foldername_cache", a matriz é salva em "pesos_idw_<hash>.npz" e
+    reaproveitada nas próximas execuções (outros períodos, novas datas).
+    '''
+    filename = None
+    if len(foldername_cache) > 0:
+        chave = chave_pesos(lons_origem, lats_origem, lons_alvo, lats_alvo, neighbors, idw_p)
+        filename = os.path.join(foldername_cache, f'pesos_idw_{chave}.npz')
+        if os.path.isfile(filename):
+            return sparse.load_npz(filename)
+
+    lons_origem = np.asarray(lons_origem, dtype=np.float64)
+    lats_origem = np.asarray(lats_origem, dtype=np.float64)
+    _, vizinhos = IndiceVizinhos(lons_origem, lats_origem).consulta(lons_alvo, lats_alvo, neighbors)
+    distancias = distancias_idw(lons_alvo, lats_alvo, lons_origem[vizinhos], lats_origem[vizinhos])
+    pesos = pesos_idw(distancias, idw_p)
+
+    linhas = np.repeat(np.arange(vizinhos.shape[0]), vizinhos.shape[1])
+    matriz = sparse.csr_matrix(
+        (pesos.reshape(-1), (linhas, vizinhos.reshape(-1))),
+        shape=(vizinhos.shape[0], len(lons_origem)),
+    )
+    matriz.eliminate_zeros()
+
+    if filename is not None:
+        os.makedirs(foldername_cache, exist_ok=True)
+        tmp = f'{filename}.{os.getpid()}.tmp.npz'
+        sparse.save_npz(tmp, matriz)
+        os.replace(tmp, filename)
+    return matriz
+
+
+def interpola_idw(cubo, matriz):
+    '''
+    IDW de todas as variáveis, em todas as datas, de uma vez.
+
+    "cubo": (datas x pontos de origem x variáveis); "matriz": ver
+    matriz_idw (ou matriz_grade, com os pesos da interpolação na grade).
+    Retorna (datas x alvos x variáveis).
+    '''
+    n_datas, n_origem, n_vars = cubo.shape
+    ret = matriz @ cubo.transpose(1, 0, 2).reshape(n_origem, n_datas * n_vars)
+    return ret.reshape(-1, n_datas, n_vars).transpose(1, 0, 2)
+
+
+def _eixo_regular(valores, tolerancia):
+    # (origem, passo, índice de cada valor) se os valores estão sobre uma
+    # sequência regular (com possíveis lacunas); senão None.
+    unicos = np.unique(valores)
+    unicos = unicos[np.append(True, np.diff(unicos) > tolerancia)]
+    if len(unicos) < 2:
+        return None
+    passo = np.min(np.diff(unicos))
+    indices = np.round((valores - unicos[0]) / passo)
+    if np.max(np.abs(unicos[0] + indices * passo - valores)) > tolerancia:
+        return None
+    return unicos[0], passo, indices.astype(np.int64)
+
+
+def grade_regular(lons, lats, tolerancia=1e-6):
+    '''
+    Se os pontos estão sobre uma grade regular lon/lat (como as de
+    gera_quadrados_simples, mesmo com pontos retirados pela borda), retorna
+    (lon0, dlon, lat0, dlat, grade), com "grade" (lats x lons) a posição de
+    cada ponto ou -1 nos nós sem ponto. Senão, retorna None.
+    '''
+    eixo_x = _eixo_regular(np.asarray(lons, dtype=np.float64), tolerancia)
+    eixo_y = _eixo_regular(np.asarray(lats, dtype=np.float64), tolerancia)
+    if eixo_x is None or eixo_y is None:
+        return None
+
+    (lon0, dlon, ix), (lat0, dlat, iy) = eixo_x, eixo_y
+    if (ix.max() + 1) * (iy.max() + 1) > 10 * len(ix):
+        # Passo definido por pontos quase coincidentes: não é uma grade.
+        return None
+    grade = np.full((iy.max() + 1, ix.max() + 1), -1, dtype=np.int64)
+    grade[iy, ix] = np.arange(len(ix))
+    if (grade >= 0).sum() != len(ix):
+        # Pontos repetidos.
+        return None
+    return lon0, dlon, lat0, dlat, grade
+
+
+def _pesos_lineares(t):
+    return np.stack([1 - t, t], axis=1)
+
+
+def _pesos_cubicos(t):
+    # Convolução cúbica de Keys (a = -0.5), nós i-1, i, i+1 e i+2.
+    a = -0.5
+    s = np.abs(np.stack([1 + t, t, 1 - t, 2 - t], axis=1))
+    return np.where(
+        s <= 1,
+        (a + 2) * s**3 - (a + 3) * s**2 + 1,
+        np.where(s < 2, a * s**3 - 5 * a * s**2 + 8 * a * s - 4 * a, 0.0),
+    )
+
+
+def matriz_grade(lons_origem, lats_origem, lons_alvo, lats_alvo, algoritmo, neighbors, idw_p, foldername_cache=''):
+    '''
+    Matriz esparsa (alvos x pontos de origem) da interpolação 'BILINEAR' ou
+    'BICUBIC' em uma grade regular de pontos de origem: a célula de cada
+    alvo é calculada aritmeticamente, sem busca de vizinhos.
+
+    Alvos fora da grade ou com nós faltando usam a bilinear (no caso da
+    bicúbica) e, por fim, o IDW (matriz_idw). Retorna None se os pontos de
+    origem não formam uma grade regular.
+    '''
+    grade = grade_regular(lons_origem, lats_origem)
+    if grade is None:
+        return None
+    lon0, dlon, lat0, dlat, grade = grade
+    lons_alvo = np.asarray(lons_alvo, dtype=np.float64)
+    lats_alvo = np.asarray(lats_alvo, dtype=np.float64)
+    fx = (lons_alvo - lon0) / dlon
+    fy = (lats_alvo - lat0) / dlat
+
+    ordens = [(2, _pesos_lineares)]
+    if algoritmo.upper() == 'BICUBIC':
+        ordens.insert(0, (4, _pesos_cubicos))
+
+    # Alvos fora de [0, última linha/coluna] vão direto para o IDW.
+    fora = (fx < 0) | (fx > grade.shape[1] - 1) | (fy < 0) | (fy > grade.shape[0] - 1)
+
+    linhas, colunas, pesos = [], [], []
+    pendentes = np.ones(len(lons_alvo), dtype=bool)
+    for n, funcao in ordens:
+        alvos = np.flatnonzero(pendentes & ~fora)
+        i = np.floor(fx[alvos]).astype(np.int64)
+        j = np.floor(fy[alvos]).astype(np.int64)
+        if n == 2:
+            # Alvo exatamente sobre a última linha/coluna da grade.
+            i[i == grade.shape[1] - 1] = grade.shape[1] - 2
+            j[j == grade.shape[0] - 1] = grade.shape[0] - 2
+        deslocamentos = np.arange(n) - (n // 2 - 1)
+        ci = i[:, None] + deslocamentos
+        cj = j[:, None] + deslocamentos
+
+        dentro = ((ci >= 0) & (ci < grade.shape[1])).all(axis=1) & ((cj >= 0) & (cj < grade.shape[0])).all(axis=1)
+        nos = grade[
+            np.clip(cj, 0, grade.shape[0] - 1)[:, :, None],
+            np.clip(ci, 0, grade.shape[1] - 1)[:, None, :],
+        ]
+        ok = dentro & (nos >= 0).all(axis=(1, 2))
+
+        w = funcao(fy[alvos] - j)[:, :, None] * funcao(fx[alvos] - i)[:, None, :]
+        linhas.append(np.repeat(alvos[ok], n * n))
+        colunas.append(nos[ok].reshape(-1))
+        pesos.append(w[ok].reshape(-1))
+        pendentes[alvos[ok]] = False
+
+    if pendentes.any():
+        alvos = np.flatnonzero(pendentes)
+        idw = matriz_idw(
+            lons_origem, lats_origem, lons_alvo[alvos], lats_alvo[alvos], neighbors, idw_p, foldername_cache
+        ).tocoo()
+        linhas.append(alvos[idw.row])
+        colunas.append(idw.col)
+        pesos.append(idw.data)
+
+    matriz = sparse.csr_matrix(
+        (np.concatenate(pesos), (np.concatenate(linhas), np.concatenate(colunas))),
+        shape=(len(lons_alvo), len(lons_origem)),
+    )
+    matriz.eliminate_zeros()
+    return matriz
+
+
+def ajusta_kriging(xy, valores):
+    '''
+    Ajusta a krigagem (tendência constante, covariância exponencial
+    quadrática) aos pontos "xy" (N x 2) e retorna o resultado do openturns.
+    '''
+    inputDimension = 2
+    basis = ot.ConstantBasisFactory(inputDimension).build()
+    covarianceModel = ot.SquaredExponential([1.] * inputDimension, [1.0])
+
+    algo = ot.KrigingAlgorithm(
+        ot.Sample(np.asarray(xy, dtype=np.float64)),
+        ot.Sample(np.asarray(valores, dtype=np.float64).reshape(-1, 1)),
+        covarianceModel,
+        basis,
+    )
+    algo.run()
+    return algo.getResult()
+
+
+def matriz_kriging(modelo, xy_origem, xy_alvo):
+    '''
+    Pesos (alvos x pontos de origem) da krigagem com tendência constante e
+    covariância "modelo": a previsão é matriz @ valores, a mesma do
+    metamodelo do openturns. A covariância dos pontos de origem é fatorada
+    uma única vez.
+    '''
+    origem = ot.Sample(np.asarray(xy_origem, dtype=np.float64))
+    covariancia = np.array(modelo.discretize(origem))
+    cruzada = np.array(modelo.computeCrossCovariance(ot.Sample(np.asarray(xy_alvo, dtype=np.float64)), origem))
+
+    # Covariância mal condicionada (pontos muito próximos): pequena pepita.
+    pepita = 0.0
+    escala = np.mean(np.diag(covariancia))
+    while True:
+        try:
+            fator = cho_factor(covariancia + pepita * escala * np.eye(len(covariancia)))
+            break
+        except LinAlgError:
+            if pepita >= 1e-4:
+                raise
+            pepita = 1e-12 if pepita == 0 else pepita * 100
+
+    # Tendência constante por mínimos quadrados generalizados:
+    # beta = 1'K^-1 y / 1'K^-1 1 e previsão = beta + c'K^-1 (y - beta).
+    k1 = cho_solve(fator, np.ones(len(covariancia)))
+    matriz = cho_solve(fator, cruzada.T).T
+    matriz += np.outer(1 - matriz.sum(axis=1), k1 / k1.sum())
+    return matriz
+
+
+def interpola_kriging_global(cubo, lons_origem, lats_origem, lons_alvo, lats_alvo):
+    '''
+    Krigagem com todos os pontos de origem, para todas as datas e alvos.
+
+    Para cada variável, o modelo é ajustado uma vez, na data de maior
+    variância entre os pontos (um campo constante não define o modelo), e
+    aplicado a todas as datas do "cubo" (datas x pontos de origem x
+    variáveis). Retorna (datas x alvos x variáveis).
+    '''
+    xy_origem = np.column_stack([lons_origem, lats_origem])
+    xy_alvo = np.column_stack([lons_alvo, lats_alvo])
+
+    ret = np.empty((cubo.shape[0], len(xy_alvo), cubo.shape[2]))
+    for v in range(cubo.shape[2]):
+        variancia = np.var(cubo[:, :, v], axis=1)
+        if not np.nanmax(variancia, initial=0) > 0:
+            # Campo constante (ou sem dados) em todas as datas.
+            matriz = np.full((len(xy_alvo), len(xy_origem)), 1 / len(xy_origem))
+        else:
+            d = np.nanargmax(variancia)
+            modelo = ajusta_kriging(xy_origem, cubo[d, :, v]).getCovarianceModel()
+            matriz = matriz_kriging(modelo, xy_origem, xy_alvo)
+        ret[:, :, v] = cubo[:, :, v] @ matriz.T
+    return ret
+
+
+def interpola_kriging_local(cubo, lons_origem, lats_origem, lons_alvo, lats_alvo, neighbors):
+    '''
+    Krigagem local: cada alvo usa seus "neighbors" vizinhos. Alvos com os
+    mesmos vizinhos compartilham o ajuste (um por data e variável) e são
+    avaliados de uma vez. Retorna (datas x alvos x variáveis).
+    '''
+    xy_origem = np.column_stack([lons_origem, lats_origem])
+    _, vizinhos = IndiceVizinhos(lons_origem, lats_origem).consulta(lons_alvo, lats_alvo, neighbors)
+    grupos = {}
+    for i, viz in enumerate(vizinhos):
+        grupos.setdefault(tuple(np.sort(viz)), []).append(i)
+
+    ret = np.empty((cubo.shape[0], len(vizinhos), cubo.shape[2]))
+    for viz, alvos in grupos.items():
+        viz = list(viz)
+        xy_pred = ot.Sample(np.column_stack([np.asarray(lons_alvo)[alvos], np.asarray(lats_alvo)[alvos]]))
+        for d in range(cubo.shape[0]):
+            for v in range(cubo.shape[2]):
+                metamodelo = ajusta_kriging(xy_origem[viz], cubo[d, viz, v]).getMetaModel()
+                ret[d, alvos, v] = np.array(metamodelo(xy_pred))[:, 0]
+    return ret
+
+
+def interpola_cubo(algoritmo, cubo, lons_origem, lats_origem, lons_alvo, lats_alvo, neighbors, matriz=None):
+    '''
+    Interpola o "cubo" (datas x pontos de origem x variáveis) nos alvos com
+    a "matriz" de pesos (IDW, BILINEAR e BICUBIC: ver matriz_idw e
+    matriz_grade), 'KRIGING' ou 'KRIGING_GLOBAL'.
+    '''
+    if matriz is not None:
+        return interpola_idw(cubo, matriz)
+    if algoritmo.upper() == 'KRIGING_GLOBAL':
+        return interpola_kriging_global(cubo, lons_origem, lats_origem, lons_alvo, lats_alvo)
+    return interpola_kriging_local(cubo, lons_origem, lats_origem, lons_alvo, lats_alvo, neighbors)
+
+
+# Estado de cada processo de InterpolacaoParalela.
+_processo = {}
+
+
+def _compartilha(array):
+    # Copia "array" para uma memória compartilhada nova: (memória,
+    # (nome, shape, dtype)), o descritor usado por _anexa.
+    memoria = SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=memoria.buf)[:] = array
+    return memoria, (memoria.name, array.shape, array.dtype.str)
+
+
+def _anexa(descritor):
+    nome, shape, dtype = descritor
+    memoria = SharedMemory(name=nome)
+    return memoria, np.ndarray(shape, dtype=dtype, buffer=memoria.buf)
+
+
+def _inicia_processo(memorias, lons_alvo, lats_alvo, neighbors):
+    for nome, descritor in memorias.items():
+        _processo[f'memoria_{nome}'], _processo[nome] = _anexa(descritor)
+    _processo['lons_alvo'] = lons_alvo
+    _processo['lats_alvo'] = lats_alvo
+    _processo['neighbors'] = neighbors
+
+
+def _matriz_processo(matriz):
+    # Matriz de pesos publicada por InterpolacaoParalela.interpola: "matriz"
+    # é (shape, descritores de data, indices e indptr). Anexada uma vez por
+    # matriz em cada processo.
+    if matriz is None:
+        return None
+    shape, descritores = matriz
+    if _processo.get('descritores_matriz') != descritores:
+        _processo.pop('matriz', None)
+        for memoria in _processo.pop('memorias_matriz', []):
+            memoria.close()
+        memorias, arrays = zip(*[_anexa(descritor) for descritor in descritores])
+        _processo['matriz'] = sparse.csr_matrix(arrays, shape=shape, copy=False)
+        _processo['memorias_matriz'] = memorias
+        _processo['descritores_matriz'] = descritores
+    return _processo['matriz']
+
+
+def _executa_tarefa(tarefa):
+    algoritmo, fatias, alvos, variaveis, matriz = tarefa
+    valores, coords = _processo['valores'], _processo['coords']
+    inicio, fim = fatias[0]
+    cubo = np.stack([valores[i:f][:, variaveis] for i, f in fatias])
+    return interpola_cubo(
+        algoritmo,
+        cubo,
+        coords[inicio:fim, 0],
+        coords[inicio:fim, 1],
+        _processo['lons_alvo'][alvos],
+        _processo['lats_alvo'][alvos],
+        _processo['neighbors'],
+        _matriz_processo(matriz),
+    )
+
+
+class InterpolacaoParalela:
+    '''
+    Interpolação em um pool de "processos" processos.
+
+    Valores (linhas x variáveis) e coordenadas (linhas x 2) dos pontos com
+    dados ficam em memória compartilhada, lidos pelos processos sem cópia;
+    cada tarefa leva apenas as fatias (início, fim) de linhas de cada data.
+    A matriz de pesos (IDW, BILINEAR e BICUBIC) também vai para a memória
+    compartilhada, uma vez por matriz, e as tarefas levam só os nomes.
+    A divisão é por datas (com matriz de pesos),
+    variáveis (KRIGING_GLOBAL) ou alvos (KRIGING), e os resultados são
+    montados sempre na mesma ordem.
+    '''
+
+    def __init__(self, processos, valores, lons, lats, lons_alvo, lats_alvo, neighbors):
+        self.processos = processos
+        self.n_alvos = len(lons_alvo)
+        self.n_vars = valores.shape[1]
+
+        self._memorias = []
+        nomes = {}
+        for nome, array in (('valores', valores), ('coords', np.column_stack([lons, lats]))):
+            memoria, nomes[nome] = _compartilha(np.ascontiguousarray(array, dtype=np.float64))
+            self._memorias.append(memoria)
+
+        # Matriz de pesos publicada (ver _publica_matriz).
+        self._matriz = None
+        self._memorias_matriz = []
+        self._descritor_matriz = None
+
+        self._executor = ProcessPoolExecutor(
+            max_workers=processos,
+            initializer=_inicia_processo,
+            initargs=(nomes, np.asarray(lons_alvo), np.asarray(lats_alvo), neighbors),
+        )
+
+    def interpola(self, algoritmo, fatias, matriz=None):
+        '''
+        Interpola as datas "fatias" (lista de (início, fim), um conjunto de
+        pontos de origem): (datas x alvos x variáveis).
+        '''
+        todos_alvos = slice(None)
+        todas_vars = list(range(self.n_vars))
+        if matriz is not None:
+            eixo = 0
+            descritor = self._publica_matriz(matriz)
+            tarefas = [
+                (algoritmo, [fatias[d] for d in datas], todos_alvos, todas_vars, descritor)
+                for datas in np.array_split(np.arange(len(fatias)), min(self.processos, len(fatias)))
+            ]
+        elif algoritmo.upper() == 'KRIGING_GLOBAL':
+            eixo = 2
+            tarefas = [(algoritmo, fatias, todos_alvos, [v], None) for v in todas_vars]
+        else:
+            eixo = 1
+            tarefas = [
+                (algoritmo, fatias, alvos, todas_vars, None)
+                for alvos in np.array_split(np.arange(self.n_alvos), min(4 * self.processos, self.n_alvos))
+            ]
+        return np.concatenate(list(self._executor.map(_executa_tarefa, tarefas)), axis=eixo)
+
+    def _publica_matriz(self, matriz):
+        # Copia data, indices e indptr da matriz para a memória compartilhada,
+        # só quando a matriz muda (um novo bloco de pontos de origem).
+        if matriz is not self._matriz:
+            self._libera_matriz()
+            csr = matriz.tocsr()
+            descritores = []
+            for array in (csr.data, csr.indices, csr.indptr):
+                memoria, descritor = _compartilha(np.ascontiguousarray(array))
+                self._memorias_matriz.append(memoria)
+                descritores.append(descritor)
+            self._matriz = matriz
+            self._descritor_matriz = (csr.shape, tuple(descritores))
+        return self._descritor_matriz
+
+    def _libera_matriz(self):
+        for memoria in self._memorias_matriz:
+            memoria.close()
+            memoria.unlink()
+        self._matriz = None
+        self._memorias_matriz = []
+        self._descritor_matriz = None
+
+    def close(self):
+        self._executor.shutdown()
+        self._libera_matriz()
+        for memoria in self._memorias:
+            memoria.close()
+            memoria.unlink()
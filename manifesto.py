@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Text, Tuple, Union
+
+import numpy as np
+
+
+class ManifestoDownload:
+    '''
+    Registro (SQLite) do andamento do download por ponto, salvo na pasta de
+    saída: status, número de tentativas, hash do payload e checksums dos
+    arquivos gerados. Permite retomar uma execução interrompida baixando
+    apenas os pontos que não foram concluídos.
+    '''
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(filename, check_same_thread=False)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        self._con.execute('''
+            CREATE TABLE IF NOT EXISTS pontos (
+                lat REAL NOT NULL,
+                lon REAL NOT NULL,
+                status TEXT NOT NULL,
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                payload_hash TEXT,
+                checksums TEXT,
+                erro TEXT,
+                atualizado REAL,
+                PRIMARY KEY (lat, lon)
+            )
+        ''')
+        self._con.commit()
+
+    @staticmethod
+    def payload_hash(params: List, start_date: int, end_date: int) -> Text:
+        texto = json.dumps({'params': sorted(params), 'start': str(start_date), 'end': str(end_date)},
+                           sort_keys=True)
+        return hashlib.sha256(texto.encode('utf-8')).hexdigest()
+
+    def _execute(self, sql: Text, args: Tuple):
+        with self._lock:
+            self._con.execute(sql, args)
+            self._con.commit()
+
+    def inicia(self, point: Tuple, payload_hash: Text):
+        self._execute('''
+            INSERT INTO pontos (lat, lon, status, tentativas, payload_hash, atualizado)
+            VALUES (?, ?, 'em_andamento', 1, ?, ?)
+            ON CONFLICT (lat, lon) DO UPDATE SET
+                status = 'em_andamento',
+                tentativas = tentativas + 1,
+                payload_hash = excluded.payload_hash,
+                atualizado = excluded.atualizado
+        ''', (point[0], point[1], payload_hash, time.time()))
+
+    def conclui(self, point: Tuple, checksums: Dict):
+        self._execute('''
+            UPDATE pontos SET status = 'concluido', checksums = ?, erro = NULL, atualizado = ?
+            WHERE lat = ? AND lon = ?
+        ''', (json.dumps(checksums, sort_keys=True), time.time(), point[0], point[1]))
+
+    def falha(self, point: Tuple, erro: Text):
+        self._execute('''
+            UPDATE pontos SET status = 'falhou', erro = ?, atualizado = ?
+            WHERE lat = ? AND lon = ?
+        ''', (erro, time.time(), point[0], point[1]))
+
+    def concluidos(self, payload_hash: Text) -> Dict:
+        '''
+        {(lat, lon): checksums} dos pontos concluídos com o mesmo payload.
+        '''
+        with self._lock:
+            rows = self._con.execute('''
+                SELECT lat, lon, checksums FROM pontos
+                WHERE status = 'concluido' AND payload_hash = ?
+            ''', (payload_hash,)).fetchall()
+        return {(lat, lon): json.loads(checksums) for lat, lon, checksums in rows}
+
+    def pendentes(self, points_lat_lon: List, payload_hash: Text, foldername: Text) -> List:
+        '''
+        Pontos que ainda precisam ser baixados: sem registro, com falha, com
+        outro payload, ou cujos arquivos não conferem com os checksums salvos.
+        '''
+        concluidos = self.concluidos(payload_hash)
+        ret = []
+        for point in points_lat_lon:
+            checksums = concluidos.get((point[0], point[1]))
+            if checksums is None or checksums_arquivos(foldername, list(checksums)) != checksums:
+                ret.append(point)
+        return ret
+
+    def resumo(self) -> Dict:
+        with self._lock:
+            rows = self._con.execute('SELECT status, COUNT(*) FROM pontos GROUP BY status').fetchall()
+        return dict(rows)
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+
+class ManifestoInterpolacao:
+    '''
+    Registro (SQLite) das datas gravadas na saída da interpolação: hash dos
+    dados de origem da data (pontos e valores), hash da configuração (pontos
+    a interpolar, algoritmo e parâmetros) e, no parquet, o fragmento que
+    contém a data. Permite reinterpolar apenas as datas novas ou cujos dados
+    mudaram.
+    '''
+
+    def __init__(self, filename: str):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(filename, check_same_thread=False)
+        self._con.execute('PRAGMA journal_mode=WAL')
+        self._con.execute('''
+            CREATE TABLE IF NOT EXISTS datas (
+                date TEXT NOT NULL PRIMARY KEY,
+                hash_dados TEXT NOT NULL,
+                hash_config TEXT NOT NULL,
+                fragmento TEXT,
+                atualizado REAL
+            )
+        ''')
+        self._con.commit()
+
+    @staticmethod
+    def config_hash(lons_alvo, lats_alvo, algorithm: Text, neighbors: int, idw_p: float, cols: List) -> Text:
+        h = hashlib.sha256()
+        for coords in (lons_alvo, lats_alvo):
+            h.update(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+        texto = json.dumps({'algorithm': algorithm.upper(), 'neighbors': neighbors, 'idw_p': idw_p, 'cols': cols},
+                           sort_keys=True)
+        h.update(texto.encode('utf-8'))
+        return h.hexdigest()
+
+    @staticmethod
+    def dados_hash(lons, lats, valores) -> Text:
+        h = hashlib.sha256()
+        for array in (lons, lats, valores):
+            h.update(np.ascontiguousarray(array, dtype=np.float64).tobytes())
+        return h.hexdigest()
+
+    def registradas(self) -> Dict:
+        '''
+        {data (aaaammdd): (hash_dados, hash_config, fragmento)}.
+        '''
+        with self._lock:
+            rows = self._con.execute('SELECT date, hash_dados, hash_config, fragmento FROM datas').fetchall()
+        return {date: (hash_dados, hash_config, fragmento) for date, hash_dados, hash_config, fragmento in rows}
+
+    def registra(self, datas: List, hashes: List, hash_config: Text, fragmento: Union[Text, None] = None):
+        agora = time.time()
+        with self._lock:
+            self._con.executemany('''
+                INSERT INTO datas (date, hash_dados, hash_config, fragmento, atualizado)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (date) DO UPDATE SET
+                    hash_dados = excluded.hash_dados,
+                    hash_config = excluded.hash_config,
+                    fragmento = excluded.fragmento,
+                    atualizado = excluded.atualizado
+            ''', [(date, hash_dados, hash_config, fragmento, agora) for date, hash_dados in zip(datas, hashes)])
+            self._con.commit()
+
+    def remove(self, datas: List):
+        with self._lock:
+            self._con.executemany('DELETE FROM datas WHERE date = ?', [(date,) for date in datas])
+            self._con.commit()
+
+    def limpa(self):
+        with self._lock:
+            self._con.execute('DELETE FROM datas')
+            self._con.commit()
+
+    def close(self):
+        with self._lock:
+            self._con.close()
+
+
+def checksums_arquivos(foldername: Text, filenames: List) -> Dict:
+    '''
+    {nome: sha1} dos arquivos, com nomes relativos a "foldername".
+    '''
+    ret = {}
+    for filename in filenames:
+        path = os.path.join(foldername, filename)
+        if not os.path.isfile(path):
+            ret[filename] = None
+            continue
+        with open(path, 'rb') as f:
+            ret[filename] = hashlib.sha1(f.read()).hexdigest()
+    return ret
@@ -57,13 +57,14 @@ def execute():
 
     print('Etapa 3: Gera_BD_Download.\n')
 
-    df_mes, df_bim, df_tri, df_sem, df_ano, df_his = \
+    df_mes, df_bim, df_tri, df_sem, df_ano, df_his, _ = \
         cli_Gera_BD_Download.execute_gera_bd_download(
             filename_input = filename_gera_grid_download, 
             foldername_output = './dados/BD_PB',
             date_initial = 20000101,
             date_final = 20230530,
             verbose = verbose, 
+            foldername_cache = './dados/cache_nasa',
     )
     df_his.to_csv(filename_dados_apos_download, sep=';', date_format='%Y%m%d')
 
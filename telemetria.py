@@ -0,0 +1,116 @@
+import csv
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Text, Union
+
+import numpy as np
+
+
+class Telemetria:
+    '''
+    Métricas de uma execução do download: latência, bytes e status de cada
+    requisição à NASA, retentativas por status, tempo de espera (backoff) e
+    tempo gasto em cada etapa do processamento (leitura, limpeza, agregação
+    e gravação). O relatório (salva) fica na pasta de saída, para
+    dimensionar a concorrência e comparar execuções.
+    '''
+
+    def __init__(self):
+        self.inicio = time.time()
+        self._lock = threading.Lock()
+        self._requisicoes = []
+        self.status = Counter()
+        self.retentativas = Counter()
+        self.espera = 0.0
+        self._etapas = defaultdict(lambda: [0, 0.0])
+
+    def registra_requisicao(self, latencia: float, status: Union[int, Text], tamanho: int = 0):
+        '''
+        "status": código HTTP, 'timeout' ou 'erro' (falha de conexão).
+        '''
+        with self._lock:
+            self._requisicoes.append((time.time() - self.inicio, latencia, status, tamanho))
+            self.status[status] += 1
+
+    def registra_retentativa(self, status: Union[int, Text], espera: float = 0.0):
+        with self._lock:
+            self.retentativas[status] += 1
+            self.espera += espera
+
+    def registra_etapas(self, tempos: Dict):
+        '''
+        "tempos": {etapa: segundos}, como retornado por backend.processa.
+        '''
+        with self._lock:
+            for etapa, segundos in tempos.items():
+                self._etapas[etapa][0] += 1
+                self._etapas[etapa][1] += segundos
+
+    def resumo(self) -> Dict:
+        with self._lock:
+            latencias = np.array([r[1] for r in self._requisicoes if r[2] == 200])
+            tamanho = sum(r[3] for r in self._requisicoes)
+            ret = {
+                'duracao': round(time.time() - self.inicio, 3),
+                'requisicoes': len(self._requisicoes),
+                'bytes': int(tamanho),
+                'status': {str(k): v for k, v in self.status.items()},
+                'retentativas': {str(k): v for k, v in self.retentativas.items()},
+                'espera': round(self.espera, 3),
+                'latencia': None,
+                'etapas': {
+                    etapa: {'n': n, 'total': round(total, 3), 'media': round(total / n, 4)}
+                    for etapa, (n, total) in self._etapas.items()
+                },
+            }
+        if len(latencias) > 0:
+            ret['latencia'] = {
+                'media': round(float(latencias.mean()), 4),
+                'p50': round(float(np.percentile(latencias, 50)), 4),
+                'p90': round(float(np.percentile(latencias, 90)), 4),
+                'p99': round(float(np.percentile(latencias, 99)), 4),
+                'max': round(float(latencias.max()), 4),
+            }
+        return ret
+
+    def salva(self, foldername: Text):
+        '''
+        Salva "telemetria.json" (resumo) e "telemetria_requisicoes.csv" (uma
+        linha por requisição) em "foldername".
+        '''
+        os.makedirs(foldername, exist_ok=True)
+        with open(os.path.join(foldername, 'telemetria.json'), 'w') as f:
+            json.dump(self.resumo(), f, indent=2)
+
+        with self._lock:
+            requisicoes = list(self._requisicoes)
+        with open(os.path.join(foldername, 'telemetria_requisicoes.csv'), 'w', newline='') as f:
+            writer = csv.writer(f, delimiter=';')
+            writer.writerow(['instante', 'latencia', 'status', 'bytes'])
+            for instante, latencia, status, tamanho in requisicoes:
+                writer.writerow([f'{instante:.3f}', f'{latencia:.4f}', status, tamanho])
+
+
+class Cronometro:
+    '''
+    Tempo de etapas consecutivas do processamento: marca(etapa) soma à
+    etapa o tempo desde a marca anterior. "tempos" ({etapa: segundos}) é
+    simples de devolver de outro processo para a Telemetria.
+    '''
+
+    def __init__(self):
+        self.tempos = {}
+        self._ultimo = time.perf_counter()
+
+    def marca(self, etapa: Text):
+        agora = time.perf_counter()
+        self.tempos[etapa] = self.tempos.get(etapa, 0.0) + agora - self._ultimo
+        self._ultimo = agora
+
+    def soma(self, tempos: Union[Dict, None]):
+        for etapa, segundos in (tempos or {}).items():
+            self.tempos[etapa] = self.tempos.get(etapa, 0.0) + segundos
+        self._ultimo = time.perf_counter()
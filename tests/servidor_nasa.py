@@ -0,0 +1,142 @@
+'''
+Servidor local que imita os endpoints temporal/daily/point e
+temporal/daily/regional da NASA POWER, com respostas fixas (as mesmas para
+todos os pontos de uma célula da grade nativa) e, opcionalmente, falhas
+(429, 503, ...) nas primeiras requisições ou em pontos escolhidos.
+'''
+import asyncio
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+from aiohttp import web
+
+# Grade nativa (lat, lon) da NASA POWER, a mesma de backend.resolucao_nativa.
+resolucao = (0.5, 0.625)
+
+
+def celula(lat, lon):
+    return (round(round(lat / resolucao[0]) * resolucao[0], 4),
+            round(round(lon / resolucao[1]) * resolucao[1], 4))
+
+
+def valor(param, data, celula=(0.0, 0.0)):
+    # Valor fixo do parâmetro na data e na célula nativa.
+    codigo = sum(map(ord, param)) % 97
+    return round(codigo + (data - pd.Timestamp('2000-01-01')).days / 1000
+                 + celula[0] / 10 + celula[1] / 100, 4)
+
+
+def serie(param, start, end, aux):
+    datas = pd.date_range(pd.to_datetime(start, format='%Y%m%d'), pd.to_datetime(end, format='%Y%m%d'))
+    return {data.strftime('%Y%m%d'): valor(param, data, aux) for data in datas}
+
+
+def resposta(lat, lon, parametros, start, end):
+    # Resposta do endpoint "point": coordenadas pedidas, dados da célula.
+    aux = celula(lat, lon)
+    return {
+        'geometry': {'coordinates': [lon, lat, 10.0]},
+        'properties': {'parameter': {param: serie(param, start, end, aux) for param in parametros}},
+    }
+
+
+def resposta_regional(lat_min, lat_max, lon_min, lon_max, parametros, start, end):
+    # Resposta do endpoint "regional": uma feature por célula nativa da caixa.
+    features = []
+    for lat in np.arange(np.ceil(lat_min / resolucao[0]) * resolucao[0], lat_max + 1e-9, resolucao[0]):
+        for lon in np.arange(np.ceil(lon_min / resolucao[1]) * resolucao[1], lon_max + 1e-9, resolucao[1]):
+            aux = celula(lat, lon)
+            features.append({
+                'geometry': {'coordinates': [aux[1], aux[0], 10.0]},
+                'properties': {'parameter': {param: serie(param, start, end, aux) for param in parametros}},
+            })
+    return {'type': 'FeatureCollection', 'features': features}
+
+
+@asynccontextmanager
+async def servidor_nasa(falhas=(), erros=None, atraso=0.0):
+    '''
+    Sobe o servidor em uma porta livre e retorna (url_api, estado):
+    "estado.status" recebe o status de cada resposta e
+    "estado.max_simultaneas" o máximo de requisições em andamento. As
+    primeiras respostas têm os status de "falhas", na ordem; os pontos de
+    "erros" ({(lat, lon): status}) recebem sempre o status dado. Cada
+    resposta do endpoint "point" demora "atraso" segundos;
+    "estado.regionais" conta as requisições regionais.
+    '''
+    falhas = list(falhas)
+    erros = erros or {}
+    estado = SimpleNamespace(status=[], simultaneas=0, max_simultaneas=0, regionais=0)
+
+    async def point(request):
+        estado.simultaneas += 1
+        estado.max_simultaneas = max(estado.max_simultaneas, estado.simultaneas)
+        try:
+            await asyncio.sleep(atraso)
+            q = request.query
+            status = erros.get((float(q['latitude']), float(q['longitude'])))
+            if status is None and len(falhas) > 0:
+                status = falhas.pop(0)
+            if status is not None:
+                estado.status.append(status)
+                return web.Response(status=status)
+            estado.status.append(200)
+            return web.json_response(resposta(
+                float(q['latitude']), float(q['longitude']), q['parameters'].split(','), q['start'], q['end']
+            ))
+        finally:
+            estado.simultaneas -= 1
+
+    async def regional(request):
+        q = request.query
+        estado.status.append(200)
+        estado.regionais += 1
+        return web.json_response(resposta_regional(
+            float(q['latitude-min']), float(q['latitude-max']),
+            float(q['longitude-min']), float(q['longitude-max']),
+            q['parameters'].split(','), q['start'], q['end'],
+        ))
+
+    app = web.Application()
+    app.router.add_get('/api/temporal/daily/point', point)
+    app.router.add_get('/api/temporal/daily/regional', regional)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    porta = runner.addresses[0][1]
+    try:
+        yield f'http://127.0.0.1:{porta}/api/temporal/daily', estado
+    finally:
+        await runner.cleanup()
+
+
+@contextmanager
+def servidor_nasa_thread(**kwargs):
+    '''
+    servidor_nasa em um event loop próprio, em outra thread, para testar
+    funções síncronas que rodam o seu próprio event loop.
+    '''
+    loop = asyncio.new_event_loop()
+    pronto = threading.Event()
+    parar = asyncio.Event()
+    ret = []
+
+    async def main():
+        async with servidor_nasa(**kwargs) as aux:
+            ret.append(aux)
+            pronto.set()
+            await parar.wait()
+
+    thread = threading.Thread(target=loop.run_until_complete, args=(main(),))
+    thread.start()
+    pronto.wait()
+    try:
+        yield ret[0]
+    finally:
+        loop.call_soon_threadsafe(parar.set)
+        thread.join()
+        loop.close()
@@ -0,0 +1,55 @@
+import pandas as pd
+import pytest
+from click.testing import CliRunner
+
+import api_nasa
+import cli_Gera_BD_Download
+from servidor_nasa import servidor_nasa_thread
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    # Espera entre tentativas: abs(60 * (5 + randn())) = 0.
+    monkeypatch.setattr(api_nasa, 'randn', lambda: -5.0)
+    # execute_gera_bd_download troca url_api e telemetria: restaura ao fim.
+    monkeypatch.setattr(api_nasa, 'url_api', api_nasa.url_api)
+    monkeypatch.setattr(api_nasa, 'telemetria', None)
+
+
+def grid(tmp_path, pontos):
+    filename = str(tmp_path / 'pontos.csv')
+    pd.DataFrame({
+        'center_point': [f'POINT ({lon} {lat})' for lat, lon in pontos],
+        'envelope': [
+            f'POLYGON (({lon - 0.25} {lat - 0.25}, {lon + 0.25} {lat - 0.25}, {lon + 0.25} {lat + 0.25}, '
+            f'{lon - 0.25} {lat + 0.25}, {lon - 0.25} {lat - 0.25}))'
+            for lat, lon in pontos
+        ],
+    }).to_csv(filename, sep=';')
+    return filename
+
+
+def test_ponto_com_falha_fica_fora_do_compactado(tmp_path):
+    '''
+    Um ponto que esgota as tentativas (422 em todas) não interrompe a
+    compactação: os demais são compactados e a CLI sai com código 1.
+    '''
+    pontos = [(-6.0, -37.0), (-6.5, -36.5), (-7.0, -36.0)]
+    filename_input = grid(tmp_path, pontos)
+    foldername = str(tmp_path / 'bd')
+
+    with servidor_nasa_thread(erros={(-6.0, -37.0): 422}) as (url, _):
+        *dfs, falhas = cli_Gera_BD_Download.execute_gera_bd_download(
+            filename_input, foldername, 20200101, 20201231, 'False', url_api=url,
+        )
+        assert [point for point, _ in falhas] == [(-6.0, -37.0)]
+        df_mes = dfs[0]
+        assert sorted(set(map(str, df_mes['center_point']))) == ['POINT (-36 -7)', 'POINT (-36.5 -6.5)']
+        assert len(df_mes) == 2 * 12
+
+        resultado = CliRunner().invoke(cli_Gera_BD_Download.cli_execute_gera_bd_download, [
+            '--filename_input', filename_input, '--foldername_output', foldername,
+            '--date_initial', '20200101', '--date_final', '20201231', '--url_api', url,
+        ])
+    assert resultado.exit_code == 1
+    assert len(pd.read_csv(f'{foldername}/mensal/compactado.csv', sep=';')) == 2 * 12
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+
+import backend
+
+
+def resposta(lat_lon, datas, valores):
+    chaves = [data.strftime('%Y%m%d') for data in datas]
+    return {
+        'geometry': {'coordinates': [lat_lon[1], lat_lon[0], 0.0]},
+        'properties': {'parameter': {
+            param: dict(zip(chaves, valores[:, j].tolist()))
+            for j, param in enumerate(backend.params)
+        }},
+    }
+
+
+def test_refaz_dias_sem_dado_no_fim(tmp_path):
+    '''
+    Dias com -999 no fim da série (ainda não publicados pela NASA) são
+    preenchidos no diário, mas o modo incremental volta a baixá-los.
+    '''
+    foldername = str(tmp_path / 'bd')
+    backend.prepara_pastas(foldername)
+    lat_lon = (-15.5, -47.5)
+    datas = pd.date_range('2020-01-01', '2020-03-31')
+    valores = np.arange(len(datas) * len(backend.params), dtype=np.float64) \
+        .reshape(len(datas), len(backend.params)) % 97 + 1
+    valores[-7:] = -999
+    valores[-10, 3] = -999
+
+    backend.processa(lat_lon, resposta(lat_lon, datas, valores), foldername, agrega=False)
+
+    df_diario = backend.load_diario((lat_lon[1], lat_lon[0]), foldername)
+    assert df_diario.notna().all().all()
+
+    start_date, end_date, df_diario = backend.planeja_download(
+        lat_lon, 20200101, 20200331, foldername, incremental=True)
+    assert start_date == int(datas[-7].strftime('%Y%m%d'))
+    assert end_date == 20200331
+    assert df_diario.index[-1] == datas[-8]
+
+    # A NASA publica os dias que faltavam: o diário fica completo.
+    completos = valores.copy()
+    completos[-7:] = 5.0
+    backend.processa(lat_lon, resposta(lat_lon, datas[-7:], completos[-7:]), foldername,
+                     df_diario, agrega=False)
+    assert backend.planeja_download(lat_lon, 20200101, 20200331, foldername,
+                                    incremental=True) is None
+
+
+def test_nenhum_dia_completo_baixa_tudo(tmp_path):
+    foldername = str(tmp_path / 'bd')
+    backend.prepara_pastas(foldername)
+    lat_lon = (-10.0, -40.0)
+    datas = pd.date_range('2021-06-01', '2021-06-10')
+    valores = np.full((len(datas), len(backend.params)), -999.0)
+
+    backend.processa(lat_lon, resposta(lat_lon, datas, valores), foldername, agrega=False)
+
+    assert backend.planeja_download(lat_lon, 20210601, 20210610, foldername,
+                                    incremental=True) == (20210601, 20210610, None)
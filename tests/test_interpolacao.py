@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+
+import interpolacao
+
+
+@pytest.mark.parametrize('algoritmo', ['BILINEAR', 'BICUBIC'])
+def test_grade_borda_e_fora(algoritmo):
+    '''
+    Alvos sobre a última linha/coluna usam a grade; alvos fora dela usam o
+    IDW em vez de extrapolar a última célula.
+    '''
+    lons, lats = np.meshgrid(np.arange(5.0), np.arange(4.0))
+    lons, lats = lons.ravel(), lats.ravel()
+    lons_alvo = np.array([4.0, 4.5, 2.5, -0.3, 4.0])
+    lats_alvo = np.array([3.0, 1.0, 3.4, 1.0, 1.5])
+    matriz = interpolacao.matriz_grade(lons, lats, lons_alvo, lats_alvo, algoritmo, 4, 2)
+    idw = interpolacao.matriz_idw(lons, lats, lons_alvo, lats_alvo, 4, 2)
+
+    f = 2 * lons + lats
+    assert np.allclose((matriz @ f)[[0, 4]], [11.0, 9.5])
+    assert np.allclose(matriz[1:4].toarray(), idw[1:4].toarray())
@@ -0,0 +1,62 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import api_nasa
+import backend
+import bd_parquet
+from servidor_nasa import resposta, servidor_nasa
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    # Espera entre tentativas: abs(60 * (5 + randn())) = 0.
+    monkeypatch.setattr(api_nasa, 'randn', lambda: -5.0)
+
+
+def salva_diario(foldername, lat_lon, start, end):
+    data = resposta(lat_lon[0], lat_lon[1], backend.params, start, end)
+    backend.processa(lat_lon, data, foldername, agrega=False)
+
+
+def pontos_mensal(foldername):
+    df = bd_parquet.read_bd_parquet(bd_parquet.path_dataset(foldername, 'mensal'))
+    return sorted({(pt.y, pt.x) for pt in df['center_point']})
+
+
+def test_mesmo_inicio_fins_diferentes(tmp_path):
+    '''
+    Grupos de diários com o mesmo início e fins diferentes, no mesmo tile,
+    gravam fragmentos distintos.
+    '''
+    foldername = str(tmp_path / 'bd')
+    backend.prepara_pastas(foldername)
+    salva_diario(foldername, (-7.0, -37.0), '20200101', '20201231')
+    salva_diario(foldername, (-7.5, -37.5), '20200101', '20210630')
+
+    backend.processa_lote([(-7.0, -37.0), (-7.5, -37.5)], foldername, armazenamento='parquet')
+    assert pontos_mensal(foldername) == [(-7.5, -37.5), (-7.0, -37.0)]
+
+
+def test_falha_mantem_diario_salvo(tmp_path, monkeypatch):
+    '''
+    Um ponto com diário salvo cujo novo download falha continua nos
+    datasets refeitos por processa_lote.
+    '''
+    foldername = str(tmp_path / 'bd')
+    backend.prepara_pastas(foldername)
+    salva_diario(foldername, (-7.0, -37.0), '20200101', '20201231')
+
+    async def main():
+        async with servidor_nasa(erros={(-7.0, -37.0): 422}) as (url, _):
+            monkeypatch.setattr(api_nasa, 'url_api', url)
+            return await backend.download_pontos(
+                [(-7.0, -37.0), (-7.5, -37.5)], 20200101, 20201231, foldername,
+                taxa_max=100, armazenamento='parquet',
+            )
+
+    falhas = asyncio.run(main())
+    assert [point for point, _ in falhas] == [(-7.0, -37.0)]
+    assert pontos_mensal(foldername) == [(-7.5, -37.5), (-7.0, -37.0)]
@@ -0,0 +1,87 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import api_nasa
+import backend
+from servidor_nasa import servidor_nasa, valor
+
+# Pontos do mesmo tile de 9 graus, longe das bordas das células nativas.
+points_lat_lon = [(-7.1, -37.1), (-7.6, -37.6), (-6.4, -36.3)]
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    # Espera entre tentativas: abs(60 * (5 + randn())) = 0.
+    monkeypatch.setattr(api_nasa, 'randn', lambda: -5.0)
+
+
+def test_bbox_tile():
+    # Um ponto: caixa com o lado mínimo, centrada no ponto.
+    assert backend.bbox_tile([(-7.0, -36.0)]) == (-8.0, -6.0, -37.0, -35.0)
+    # Pontos espalhados: só a margem em volta deles.
+    assert backend.bbox_tile([(-9.0, -38.0), (-6.0, -35.0)]) == (-9.5, -5.5, -38.5, -34.5)
+
+
+def test_divide_regional():
+    def feature(lat, lon, j):
+        return {
+            'geometry': {'coordinates': [lon, lat, 10.0]},
+            'properties': {'parameter': {'T2M': {'20200101': j, '20200102': j + 0.5}}},
+        }
+
+    datas = [{'features': [feature(-7.0, -36.25, 1), feature(-7.5, -36.875, 2)]}]
+    ret = backend.divide_regional(datas, [(-7.1, -36.3), (-7.4, -36.8)], [20200101, 20200102])
+
+    assert ret[0]['geometry']['coordinates'] == [-36.3, -7.1]
+    assert ret[0]['properties']['parameter'] == {'T2M': {'20200101': 1, '20200102': 1.5}}
+    assert ret[1]['properties']['parameter'] == {'T2M': {'20200102': 2.5}}
+
+
+def test_regional_igual_ao_ponto(tmp_path, monkeypatch):
+    '''
+    O download em tile (uma requisição regional por parâmetro) gera os
+    mesmos arquivos que o download ponto a ponto.
+    '''
+    folder_ponto = str(tmp_path / 'ponto')
+    folder_regional = str(tmp_path / 'regional')
+
+    async def main():
+        async with servidor_nasa() as (url, estado):
+            monkeypatch.setattr(api_nasa, 'url_api', url)
+            async with api_nasa.nova_sessao(4, 30) as session:
+                limitador = api_nasa.LimitadorTaxa(1000)
+                for point in points_lat_lon:
+                    await backend.pipeline_async(
+                        session, point, 20190601, 20201231, folder_ponto, limitador=limitador,
+                    )
+                await backend.pipeline_regional_async(
+                    session, points_lat_lon, 20190601, 20201231, folder_regional, limitador=limitador,
+                )
+        return estado
+
+    backend.prepara_pastas(folder_ponto)
+    backend.prepara_pastas(folder_regional)
+    estado = asyncio.run(main())
+
+    # Dois trechos (2019 e 2020) por parâmetro.
+    assert estado.regionais == 2 * len(backend.params)
+
+    datas = pd.date_range('2019-06-01', '2020-12-31')
+    for lat, lon in points_lat_lon:
+        df_ponto = backend.load_diario((lon, lat), folder_ponto)
+        df_regional = backend.load_diario((lon, lat), folder_regional)
+        assert df_regional.index.equals(datas)
+        pd.testing.assert_frame_equal(df_regional, df_ponto)
+
+        celula = backend.celula_nativa((lat, lon))
+        esperado = [valor(param, datas[0], celula) for param in backend.params]
+        assert np.allclose(df_regional[backend.params].iloc[0].to_numpy(), esperado, atol=1e-4)
+
+        for periodo in backend.periodos:
+            filename = f'{periodo}/{lon}_{lat}.csv'
+            df_ponto = pd.read_csv(f'{folder_ponto}/{filename}', sep=';')
+            df_regional = pd.read_csv(f'{folder_regional}/{filename}', sep=';')
+            pd.testing.assert_frame_equal(df_regional, df_ponto)
@@ -0,0 +1,67 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import api_nasa
+import backend
+from servidor_nasa import servidor_nasa, valor
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    # Espera entre tentativas: abs(60 * (5 + randn())) = 0.
+    monkeypatch.setattr(api_nasa, 'randn', lambda: -5.0)
+
+
+def executa_pipeline(monkeypatch, foldername, lat_lon=(-7.0, -36.25), start_date=20190601,
+                     end_date=20201231, conexoes=4, timeout=30, **kwargs):
+    async def main():
+        async with servidor_nasa(**kwargs) as (url, estado):
+            monkeypatch.setattr(api_nasa, 'url_api', url)
+            async with api_nasa.nova_sessao(conexoes, timeout) as session:
+                await backend.pipeline_async(
+                    session, lat_lon, start_date, end_date, foldername,
+                    limitador=api_nasa.LimitadorTaxa(1000),
+                )
+        return estado
+
+    backend.prepara_pastas(foldername)
+    return asyncio.run(main())
+
+
+def test_trechos_com_throttle(tmp_path, monkeypatch):
+    foldername = str(tmp_path / 'bd')
+    estado = executa_pipeline(monkeypatch, foldername, falhas=[429, 503])
+
+    # Dois trechos (2019 e 2020), cada um repetido após uma falha.
+    assert sorted(estado.status) == [200, 200, 429, 503]
+
+    df_diario = backend.load_diario((-36.25, -7.0), foldername)
+    datas = pd.date_range('2019-06-01', '2020-12-31')
+    assert df_diario.index.equals(datas)
+    esperado = np.array([[valor(param, data, (-7.0, -36.25)) for param in backend.params] for data in datas])
+    assert np.allclose(df_diario[backend.params].to_numpy(), esperado, atol=1e-4)
+
+
+def test_trechos_erro_do_cliente(tmp_path, monkeypatch):
+    foldername = str(tmp_path / 'bd')
+    with pytest.raises(api_nasa.ErroRequisicao):
+        executa_pipeline(monkeypatch, foldername, falhas=[400] * 6, end_date=20191231)
+
+
+def test_trechos_limitados_pelas_conexoes(tmp_path, monkeypatch):
+    '''
+    Muitos trechos e poucas conexões: a espera por uma conexão livre não
+    conta como timeout e no máximo "conexoes" requisições ficam em
+    andamento.
+    '''
+    foldername = str(tmp_path / 'bd')
+    estado = executa_pipeline(
+        monkeypatch, foldername, start_date=19900101, end_date=20231231,
+        conexoes=2, timeout=0.5, atraso=0.1,
+    )
+    assert estado.status == [200] * 34
+    assert estado.max_simultaneas <= 2
+    assert backend.load_diario((-36.25, -7.0), foldername).index[-1] == pd.Timestamp('2023-12-31')